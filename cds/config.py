@@ -108,6 +108,26 @@ CACHE_REDIS_URL = os.environ.get(
     'APP_CACHE_REDIS_URL',
     'redis://localhost:6379/0')
 CACHE_TYPE = 'redis'
+#: Redis caching the files dump of the deposit buckets, or ``None`` to
+#: compute it every time.
+CDS_FILES_DUMP_CACHE_REDIS_URL = CACHE_REDIS_URL
+#: Seconds the files dump of a bucket is cached.
+CDS_FILES_DUMP_CACHE_TTL = 24 * 60 * 60
+#: Redis sharing between requests the records and keywords the ``$ref``s
+#: resolve to, or ``None`` to resolve them once per request.
+CDS_REFS_CACHE_REDIS_URL = CACHE_REDIS_URL
+#: Seconds the record of a ``$ref`` is cached.
+CDS_REFS_CACHE_TTL = 60 * 60
+#: Redis caching what the permissions on the files of each bucket depend on,
+#: or ``None`` to load the record of the bucket on each check.
+CDS_BUCKET_ACCESS_CACHE_REDIS_URL = CACHE_REDIS_URL
+#: Seconds the access of a bucket is cached.
+CDS_BUCKET_ACCESS_CACHE_TTL = 60
+#: Redis sharing between requests the admin capabilities of the identities,
+#: or ``None`` to check them once per request.
+CDS_ADMIN_ACCESS_CACHE_REDIS_URL = CACHE_REDIS_URL
+#: Seconds the admin capability of an identity is cached.
+CDS_ADMIN_ACCESS_CACHE_TTL = 60
 
 ###############################################################################
 # Database
@@ -899,6 +919,71 @@ DEPOSIT_AVC_COPYRIGHT = {
     'url': 'http://copyright.web.cern.ch',
 }
 
+###############################################################################
+# FFmpeg
+###############################################################################
+#: Extract all the frames of a video with a single ``ffmpeg`` process, which
+#: seeks once per frame (see ``scripts/benchmark-frames.py``).
+CDS_FFMPEG_FRAMES_SINGLE_PASS = True
+#: Maximum number of concurrent ``ffmpeg`` processes extracting frames one by
+#: one (i.e. when ``CDS_FFMPEG_FRAMES_SINGLE_PASS`` is disabled).
+CDS_FFMPEG_MAX_PARALLEL = 4
+#: Seconds after which the extraction of a single frame is aborted.
+CDS_FFMPEG_FRAME_TIMEOUT = 120
+#: Number of ffprobe results kept in memory by each process.
+CDS_FFMPEG_PROBE_CACHE_SIZE = 128
+#: Redis URL of the shared ffprobe cache (disabled if ``None``).
+CDS_FFMPEG_PROBE_CACHE_REDIS_URL = None
+#: Seconds the ffprobe results are kept in the shared cache.
+CDS_FFMPEG_PROBE_CACHE_REDIS_TTL = 24 * 60 * 60
+#: Maximum width of the GIF previewing the extracted frames.
+CDS_FRAMES_PREVIEW_WIDTH = 480
+
+###############################################################################
+# Sorenson
+###############################################################################
+#: Release the worker once a transcoding job is started, leaving the job to
+#: the periodic ``monitor_transcoding`` task instead of polling Sorenson.
+#: When enabled, the task has to be scheduled too, e.g. with
+#: ``CELERYBEAT_SCHEDULE['transcoding'] = {'task':
+#: 'cds.modules.webhooks.tasks.monitor_transcoding', 'schedule':
+#: timedelta(seconds=10)}``.
+CDS_SORENSON_ASYNC_MONITORING = False
+
+###############################################################################
+# AVC workflow
+###############################################################################
+#: Coalescing of the progress updates sent by the AVC tasks, by task type. A
+#: progress update is skipped if less than ``interval`` seconds have passed
+#: and the percentage moved by less than ``percentage`` since the last one.
+CDS_AVC_PROGRESS_UPDATES = {
+    'file_download': dict(interval=1, percentage=1),
+}
+#: Concurrent connections used to download a file, if the server accepts
+#: range requests.
+CDS_DOWNLOAD_CONNECTIONS = 4
+#: Size in bytes of the chunks requested on each connection.
+CDS_DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024
+#: Times a failed ranged download is resumed.
+CDS_DOWNLOAD_MAX_RETRIES = 3
+#: Seconds to wait before resuming a failed ranged download.
+CDS_DOWNLOAD_RETRY_COUNTDOWN = 10
+#: Local folder where the ranged downloads are written before being copied in
+#: their bucket, or ``None`` for the temporary folder. A folder shared by the
+#: workers lets a retry on any worker resume the download.
+CDS_DOWNLOAD_PARTIAL_FOLDER = None
+#: Redis holding the materialized status of the tasks of each deposit, or
+#: ``None`` to compute it from the webhook events on each deposit load.
+CDS_TASKS_STATUS_REDIS_URL = CACHE_REDIS_URL
+#: Seconds the tasks status of a deposit is kept after its last change.
+CDS_TASKS_STATUS_TTL = 24 * 60 * 60
+#: Redis collecting the deposits to reindex after their tasks are updated,
+#: or ``None`` to send them to the indexer immediately.
+CDS_REINDEX_QUEUE_REDIS_URL = CACHE_REDIS_URL
+#: Seconds the deposits to reindex are collected, and deduplicated, before
+#: being sent to the indexer all together.
+CDS_REINDEX_QUEUE_WINDOW = 10
+
 ###############################################################################
 # SSE
 ###############################################################################
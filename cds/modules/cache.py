@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Document Server.
+# Copyright (C) 2017 CERN.
+#
+# CERN Document Server is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Document Server is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Document Server; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Base classes of the caches and stores backed by Redis."""
+
+from __future__ import absolute_import
+
+import json
+
+from flask import current_app
+
+_redis_clients = {}
+"""Redis clients shared by all the caches, by URL."""
+
+
+def get_redis(url):
+    """Get the Redis client of a URL, created on first use."""
+    if url not in _redis_clients:
+        from redis import StrictRedis
+        _redis_clients[url] = StrictRedis.from_url(url)
+    return _redis_clients[url]
+
+
+class RedisStore(object):
+    """Base of the caches and stores backed by Redis.
+
+    The Redis URL is read from the ``redis_url_config`` configuration
+    variable, the store being disabled if it's not set. All the keys are
+    namespaced with ``prefix``.
+    """
+
+    redis_url_config = None
+    """Configuration variable of the Redis URL."""
+
+    ttl_config = None
+    """Configuration variable of the seconds the entries are kept."""
+
+    default_ttl = 60 * 60
+    """Seconds the entries are kept, if not configured."""
+
+    prefix = None
+    """Prefix of the keys."""
+
+    def _redis(self):
+        """Get the Redis client, or ``None`` if the store is disabled."""
+        url = current_app.config.get(self.redis_url_config)
+        return get_redis(url) if url else None
+
+    @property
+    def ttl(self):
+        """Seconds the entries are kept."""
+        return current_app.config.get(self.ttl_config, self.default_ttl)
+
+    def _redis_key(self, key):
+        """Namespace a key."""
+        return '{0}::{1}'.format(self.prefix, key)
+
+
+class RevisionedCache(RedisStore):
+    """Base of the caches validated against a revision counter per entry.
+
+    The revision counter of an entry is incremented to invalidate it, and a
+    value is served from the cache only if it was stored at the current
+    revision. Loading the entries needs a single ``MGET``.
+    """
+
+    def _revision_key(self, key):
+        """Build the key of the revision counter of an entry."""
+        return '{0}_revision::{1}'.format(self.prefix, key)
+
+    def load_many(self, redis, keys):
+        """Load some entries.
+
+        :returns: the current revision of each entry, and the value of the
+            entries cached at their current revision, as dictionaries by key.
+        """
+        if not keys:
+            return {}, {}
+        values = redis.mget(*[
+            redis_key for key in keys
+            for redis_key in (self._revision_key(key), self._redis_key(key))
+        ])
+        revisions = {}
+        cached = {}
+        for index, key in enumerate(keys):
+            revision, value = values[2 * index:2 * index + 2]
+            revisions[key] = int(revision or 0)
+            if value is not None:
+                value = json.loads(value.decode('utf-8'))
+                if value['revision'] == revisions[key]:
+                    cached[key] = value['value']
+        return revisions, cached
+
+    def store_many(self, redis, values, revisions):
+        """Store some entries, at the revision they were loaded from."""
+        if values:
+            ttl = self.ttl
+            pipe = redis.pipeline()
+            for key, value in values.items():
+                pipe.setex(self._redis_key(key), ttl, json.dumps(
+                    dict(revision=revisions[key], value=value)))
+            pipe.execute()
+
+    def invalidate(self, keys):
+        """Invalidate some entries."""
+        redis = self._redis()
+        if redis and keys:
+            pipe = redis.pipeline()
+            for key in keys:
+                pipe.incr(self._revision_key(key))
+                pipe.delete(self._redis_key(key))
+            pipe.execute()
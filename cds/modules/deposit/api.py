@@ -27,10 +27,10 @@
 from __future__ import absolute_import, print_function
 
 import datetime
-import itertools
 import os
 import re
 import uuid
+from collections import defaultdict
 from contextlib import contextmanager
 from functools import partial, wraps
 from os.path import splitext
@@ -43,10 +43,10 @@ from invenio_db import db
 from invenio_deposit.api import Deposit, has_status, preserve
 from invenio_files_rest.models import (Bucket, Location, MultipartObject,
                                        ObjectVersion, ObjectVersionTag,
-                                       as_bucket)
+                                       as_bucket, as_bucket_id)
 from invenio_jsonschemas import current_jsonschemas
 from invenio_pidstore.errors import PIDInvalidAction
-from invenio_pidstore.models import PersistentIdentifier
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_pidstore.resolver import Resolver
 from invenio_records.validators import PartialDraft4Validator
 from invenio_records_files.api import FileObject, FilesIterator
@@ -54,13 +54,16 @@ from invenio_records_files.models import RecordsBuckets
 from invenio_records_files.utils import sorted_files_from_bucket
 from invenio_sequencegenerator.api import Sequence
 from jsonschema.exceptions import ValidationError
+from six import string_types
 from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 
+from .cache import files_dump_cache
 from .resolver import get_video_pid
 from ..records.minters import is_local_doi, report_number_minter
 from ..records.resolver import record_resolver
 from ..webhooks.status import (ComputeGlobalStatus, get_deposit_events,
-                               get_tasks_status_by_task,
+                               get_deposits_tasks_status,
                                iterate_events_results)
 from .errors import DiscardConflict
 
@@ -98,47 +101,66 @@ class CDSFileObject(FileObject):
         return url_for('invenio_files_rest.object_api',
                        bucket_id=bucket_id, key=key, _external=_external)
 
-    def dumps(self):
-        """Create a dump of the metadata associated to the record."""
-        def _dumps(obj):
-            tags = obj.get_tags()
-            # File information
-            content_type = splitext(obj.key)[1][1:].lower()
-            context_type = tags.pop('context_type', '')
-            media_type = tags.pop('media_type', '')
-            return {
-                'key': obj.key,
-                'bucket_id': str(obj.bucket_id),
-                'version_id': str(obj.version_id),
-                'checksum': obj.file.checksum if obj.file else '',
-                'size': obj.file.size if obj.file else 0,
-                'file_id': str(obj.file_id),
-                'completed': obj.file is not None,
-                'content_type': content_type,
-                'context_type': context_type,
-                'media_type': media_type,
-                'tags': tags,
-                'links': {
-                    'self': (
-                        current_app.config['DEPOSIT_FILES_API'] +
-                        u'/{bucket}/{key}?versionId={version_id}'.format(
-                            bucket=obj.bucket_id,
-                            key=obj.key,
-                            version_id=obj.version_id,
-                        )),
-                }
+    @staticmethod
+    def _dump_object(obj, tags):
+        """Dump an object version given its tags."""
+        tags = dict(tags)
+        # File information
+        content_type = splitext(obj.key)[1][1:].lower()
+        context_type = tags.pop('context_type', '')
+        media_type = tags.pop('media_type', '')
+        return {
+            'key': obj.key,
+            'bucket_id': str(obj.bucket_id),
+            'version_id': str(obj.version_id),
+            'checksum': obj.file.checksum if obj.file else '',
+            'size': obj.file.size if obj.file else 0,
+            'file_id': str(obj.file_id),
+            'completed': obj.file is not None,
+            'content_type': content_type,
+            'context_type': context_type,
+            'media_type': media_type,
+            'tags': tags,
+            'links': {
+                'self': (
+                    current_app.config['DEPOSIT_FILES_API'] +
+                    u'/{bucket}/{key}?versionId={version_id}'.format(
+                        bucket=obj.bucket_id,
+                        key=obj.key,
+                        version_id=obj.version_id,
+                    )),
             }
+        }
 
-        master_dump = _dumps(self.obj)
-        # get all the slaves and add them inside <type> as a list order by key
-        for slave in ObjectVersion.query_heads_by_bucket(
+    def _query_slaves(self):
+        """Get the slaves of the file, ordered by key."""
+        return ObjectVersion.query_heads_by_bucket(
             bucket=self.obj.bucket).join(ObjectVersion.tags).filter(
                 ObjectVersion.file_id.isnot(None),
                 ObjectVersionTag.key == 'master',
                 ObjectVersionTag.value == str(self.obj.version_id)
-        ).order_by(func.length(ObjectVersion.key), ObjectVersion.key):
+        ).order_by(func.length(ObjectVersion.key), ObjectVersion.key)
+
+    def dumps(self, slaves=None, tags=None):
+        """Create a dump of the metadata associated to the record.
+
+        :param slaves: the slave object versions of the file, ordered by key.
+            By default they are queried.
+        :param tags: a dictionary with the tags of the file and of its slaves
+            by version id. By default they are loaded from each object.
+        """
+        def _tags(obj):
+            return tags[obj.version_id] if tags is not None \
+                else obj.get_tags()
+
+        master_dump = self._dump_object(self.obj, _tags(self.obj))
+        # get all the slaves and add them inside <type> as a list order by key
+        if slaves is None:
+            slaves = self._query_slaves()
+        for slave in slaves:
+            slave_dump = self._dump_object(slave, _tags(slave))
             master_dump.setdefault(
-                slave.get_tags()['context_type'], []).append(_dumps(slave))
+                slave_dump['context_type'], []).append(slave_dump)
         # Sort slaves by key within their lists
         self.data.update(master_dump)
 
@@ -148,15 +170,68 @@ class CDSFileObject(FileObject):
 class CDSFilesIterator(FilesIterator):
     """Iterator for files."""
 
+    def _dump_bucket(self, bucket):
+        """Dump the master files of a bucket, each with its slaves."""
+        return self.dump_buckets(
+            [bucket], file_cls=self.file_cls)[str(as_bucket_id(bucket))]
+
+    @classmethod
+    def dump_buckets(cls, bucket_ids, file_cls=CDSFileObject):
+        """Dump the master files of some buckets, each with its slaves.
+
+        The head versions of the buckets are loaded along with their files,
+        then all their tags with a second query.
+
+        :returns: a dictionary with the dump of each bucket by id.
+        """
+        bucket_ids = [str(as_bucket_id(bucket)) for bucket in bucket_ids]
+        objects = ObjectVersion.query.filter(
+            ObjectVersion.bucket_id.in_(bucket_ids),
+            ObjectVersion.file_id.isnot(None),
+            ObjectVersion.is_head.is_(True)
+        ).options(joinedload(ObjectVersion.file)).order_by(
+            ObjectVersion.key, ObjectVersion.created.desc()
+        ).all() if bucket_ids else []
+
+        tags = defaultdict(dict)
+        if objects:
+            for tag in ObjectVersionTag.query.filter(
+                    ObjectVersionTag.version_id.in_(
+                        [o.version_id for o in objects])):
+                tags[tag.version_id][tag.key] = tag.value
+
+        slaves = defaultdict(list)
+        for o in objects:
+            if 'master' in tags[o.version_id]:
+                slaves[tags[o.version_id]['master']].append(o)
+
+        dumps = {bucket_id: [] for bucket_id in bucket_ids}
+        for o in objects:
+            if 'master' not in tags[o.version_id]:
+                dumps[str(o.bucket_id)].append(file_cls(o, {}).dumps(
+                    slaves=sorted(slaves[str(o.version_id)],
+                                  key=lambda s: (len(s.key), s.key)),
+                    tags=tags))
+        return dumps
+
     def dumps(self, bucket=None):
-        """Serialize files from a bucket."""
+        """Serialize files from a bucket.
+
+        The dump of the bucket is read from the :data:`files_dump_cache`, then
+        merged with the files of the record.
+        """
+        bucket_id = as_bucket_id(bucket or self.bucket)
+        keys = self.keys
+        sortby = dict(zip(keys, range(len(keys))))
+        dumps = files_dump_cache.get(
+            bucket_id, partial(self._dump_bucket, bucket_id),
+            session=db.session())
         files = []
-        for o in sorted_files_from_bucket(bucket or self.bucket, self.keys):
-            if 'master' in o.get_tags():
-                continue
-            dump = self.file_cls(o, self.filesmap.get(o.key, {})).dumps()
-            if dump:
-                files.append(dump)
+        for dump in sorted(
+                dumps, key=lambda d: sortby.get(d['key'], len(keys))):
+            data = self.filesmap.get(dump['key'], {})
+            data.update(dump)
+            files.append(data)
         return files
 
     @staticmethod
@@ -185,7 +260,151 @@ class CDSFilesIterator(FilesIterator):
                       key=lambda s: float(s['tags']['timestamp']))
 
 
-class CDSDeposit(Deposit):
+class LazyFieldsMixin(object):
+    """Dictionary with some fields computed only when read.
+
+    The fields listed in ``_lazy_fields`` are computed by
+    :meth:`_compute_lazy_field` the first time they are read, or all
+    together when the whole dictionary is read (i.e. iterated, copied,
+    compared or serialized). Setting or deleting a field makes it not lazy
+    anymore.
+    """
+
+    def _materialize(self, key):
+        """Compute a lazy field, if not done yet."""
+        lazy_fields = self.__dict__.get('_lazy_fields')
+        if lazy_fields and key in lazy_fields:
+            lazy_fields.discard(key)
+            dict.__setitem__(self, key, self._compute_lazy_field(key))
+
+    def _compute_lazy_field(self, key):
+        """Compute the value of a lazy field."""
+        raise NotImplementedError()
+
+    def materialize(self):
+        """Compute all the lazy fields."""
+        for key in list(self.__dict__.get('_lazy_fields', [])):
+            self._materialize(key)
+        return self
+
+    def _forget(self, key):
+        """Make a field not lazy anymore."""
+        self.__dict__.get('_lazy_fields', set()).discard(key)
+
+    def __getitem__(self, key):
+        """Get a field, computing it first if lazy."""
+        self._materialize(key)
+        return super(LazyFieldsMixin, self).__getitem__(key)
+
+    def __contains__(self, key):
+        """Check a field, computing it first if lazy."""
+        self._materialize(key)
+        return super(LazyFieldsMixin, self).__contains__(key)
+
+    def get(self, key, default=None):
+        """Get a field, computing it first if lazy."""
+        self._materialize(key)
+        return super(LazyFieldsMixin, self).get(key, default)
+
+    def setdefault(self, key, default=None):
+        """Get a field, computing it first if lazy, or set it."""
+        self._materialize(key)
+        return super(LazyFieldsMixin, self).setdefault(key, default)
+
+    def pop(self, key, *args):
+        """Remove a field, computing it first if lazy."""
+        self._materialize(key)
+        return super(LazyFieldsMixin, self).pop(key, *args)
+
+    def __setitem__(self, key, value):
+        """Set a field, which is then not lazy anymore."""
+        self._forget(key)
+        super(LazyFieldsMixin, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        """Delete a field, which is then not lazy anymore."""
+        self._forget(key)
+        super(LazyFieldsMixin, self).__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        """Set some fields, which are then not lazy anymore."""
+        fields = dict(*args, **kwargs)
+        for key in fields:
+            self._forget(key)
+        super(LazyFieldsMixin, self).update(fields)
+
+    def clear(self):
+        """Remove all the fields."""
+        self.__dict__.get('_lazy_fields', set()).clear()
+        super(LazyFieldsMixin, self).clear()
+
+    def __eq__(self, other):
+        """Compare all the fields, computing them first if lazy."""
+        self.materialize()
+        if isinstance(other, LazyFieldsMixin):
+            other.materialize()
+        return super(LazyFieldsMixin, self).__eq__(other)
+
+    def __ne__(self, other):
+        """Compare all the fields, computing them first if lazy."""
+        return not self == other
+
+    __hash__ = None
+
+    def __deepcopy__(self, memo):
+        """Copy the fields, keeping the ones not computed yet lazy."""
+        copied = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copied
+        copied.__dict__.update(deepcopy(self.__dict__, memo))
+        for key, value in dict.items(self):
+            dict.__setitem__(copied, key, deepcopy(value, memo))
+        return copied
+
+
+def _read_all(name):
+    """Wrap a method reading the whole dictionary of :class:`LazyFieldsMixin`.
+
+    All the lazy fields are computed before calling it.
+    """
+    def method(self, *args, **kwargs):
+        self.materialize()
+        return getattr(super(LazyFieldsMixin, self), name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(dict, name).__doc__
+    return method
+
+
+for _name in ('__iter__', '__len__', '__repr__', 'keys', 'values', 'items',
+              'copy', 'popitem', 'iterkeys', 'itervalues', 'iteritems',
+              'viewkeys', 'viewvalues', 'viewitems'):
+    if hasattr(dict, _name):
+        setattr(LazyFieldsMixin, _name, _read_all(_name))
+
+
+class DepositMetadata(LazyFieldsMixin, dict):
+    """The ``_deposit`` field of a deposit, with its tasks status lazy.
+
+    The tasks status (``state``) is computed the first time it's read, so
+    that reading the other fields (i.e. ``id``, ``pid``, ``status`` or
+    ``created_by``) doesn't compute it.
+    """
+
+    def __init__(self, data, deposit):
+        """Init the field of a deposit."""
+        super(DepositMetadata, self).__init__(data)
+        self._deposit = deposit
+        self._lazy_fields = set(['state'])
+
+    def _compute_lazy_field(self, key):
+        """Compute the tasks status of the deposit."""
+        return self._deposit._current_tasks_status()
+
+    def __reduce_ex__(self, protocol):
+        """Pickle as a plain dictionary."""
+        return dict, (dict(self), )
+
+
+class CDSDeposit(LazyFieldsMixin, Deposit):
     """Define API for changing deposit state."""
 
     sequence_name = None
@@ -196,10 +415,30 @@ class CDSDeposit(Deposit):
     files_iter_cls = CDSFilesIterator
 
     def __init__(self, *args, **kwargs):
-        """Init."""
+        """Init.
+
+        The tasks status (``_deposit.state``) and the files dump (``_files``)
+        are computed only on first read of their field, on :meth:`dumps` and
+        on :meth:`commit`. Use :meth:`materialize` to compute them
+        immediately.
+        """
         super(CDSDeposit, self).__init__(*args, **kwargs)
-        self._update_tasks_status()
-        self['_files'] = self._get_files_dump()
+        self._lazy_fields = set(['_files'])
+        deposit = dict.get(self, '_deposit')
+        if isinstance(deposit, dict):
+            dict.__setitem__(self, '_deposit', DepositMetadata(deposit, self))
+
+    def _compute_lazy_field(self, key):
+        """Compute the files dump."""
+        return self._get_files_dump()
+
+    def materialize(self):
+        """Compute the tasks status and the files dump."""
+        super(CDSDeposit, self).materialize()
+        deposit = dict.get(self, '_deposit')
+        if isinstance(deposit, LazyFieldsMixin):
+            deposit.materialize()
+        return self
 
     @property
     def _bucket(self):
@@ -223,17 +462,28 @@ class CDSDeposit(Deposit):
         return []
 
     @classmethod
-    def get_record(cls, id_, with_deleted=False):
-        """Get record instance."""
+    def get_record(cls, id_, with_deleted=False, eager=False):
+        """Get record instance.
+
+        :param eager: compute immediately the tasks status and the files dump.
+        """
         deposit = super(CDSDeposit, cls).get_record(
             id_=id_, with_deleted=with_deleted)
+        if eager:
+            deposit.materialize()
         return deposit
 
     @classmethod
-    def get_records(cls, ids, with_deleted=False):
-        """Get records."""
+    def get_records(cls, ids, with_deleted=False, eager=False):
+        """Get records.
+
+        :param eager: compute immediately the tasks status and the files dump.
+        """
         deposits = super(CDSDeposit, cls).get_records(
             ids=ids, with_deleted=with_deleted)
+        if eager:
+            for deposit in deposits:
+                deposit.materialize()
         return deposits
 
     @classmethod
@@ -321,6 +571,7 @@ class CDSDeposit(Deposit):
         """Set partial validator as default."""
         if 'validator' not in kwargs:
             kwargs['validator'] = PartialDraft4Validator
+        self.materialize()
         return super(CDSDeposit, self).commit(**kwargs)
 
     @classmethod
@@ -531,7 +782,7 @@ class Project(CDSDeposit):
         #  return []
         ids = []
         for video in self['videos']:
-            if Video(video).is_published():
+            if video['_deposit'].get('pid') is not None:
                 ids.append(video['_deposit'].get('pid'))
             else:
                 ids.append(video['_deposit']['id'])
@@ -586,9 +837,12 @@ class Project(CDSDeposit):
         # extract the PIDs from the video deposits
         ids_old = [record_unbuild_url(video_ref) for video_ref in refs_old]
 
-        # publish them and get the new PID
-        videos_published = [video.publish().commit()
-                            for video in deposit_videos_resolver(ids_old)]
+        # publish them sharing this project, which is updated only once
+        videos_published = []
+        for video in deposit_videos_resolver(ids_old):
+            video._project = self
+            videos_published.append(
+                video.publish(update_project=False).commit())
 
         # get new video references
         refs_new = [record_build_url(video['recid'])
@@ -596,6 +850,8 @@ class Project(CDSDeposit):
 
         # update project video references
         self._update_videos(refs_old, refs_new)
+        if videos_published:
+            self.commit()
 
         return videos_published
 
@@ -677,10 +933,9 @@ class Project(CDSDeposit):
 
     def _current_tasks_status(self):
         """Return up-to-date tasks status."""
-        list_events = [get_deposit_events(depid) for depid in self.video_ids]
-        events = list(itertools.chain.from_iterable(list_events))
-        return get_tasks_status_by_task(
-            events, statuses=deepcopy(self['_deposit'].get('state', {})))
+        return get_deposits_tasks_status(
+            self.video_ids,
+            statuses=deepcopy(self['_deposit'].get('state', {})))
 
     @classmethod
     def build_video_ref(cls, video):
@@ -754,8 +1009,12 @@ class Video(CDSDeposit):
         iterate_events_results(events=events, fun=global_status)
         return global_status.status
 
-    def publish(self, pid=None, id_=None, **kwargs):
-        """Publish a video and update the related project."""
+    def publish(self, pid=None, id_=None, update_project=True, **kwargs):
+        """Publish a video and update the related project.
+
+        :param update_project: if ``False``, the caller takes care of
+            updating the video reference in the project and committing it.
+        """
         # save a copy of the old PID
         video_old_id = self['_deposit']['id']
         # check all tasks are successfully
@@ -771,13 +1030,14 @@ class Video(CDSDeposit):
         # publish the video
         video_published = super(Video, self).publish(pid=pid, id_=id_,
                                                      **kwargs)
-        _, record_new = self.fetch_published()
-        # update associated project
-        video_published.project._update_videos(
-            [video_build_url(video_old_id)],
-            [record_build_url(record_new['recid'])]
-        )
-        video_published.project.commit()
+        if update_project:
+            _, record_new = self.fetch_published()
+            # update associated project
+            video_published.project._update_videos(
+                [video_build_url(video_old_id)],
+                [record_build_url(record_new['recid'])]
+            )
+            video_published.project.commit()
         return video_published
 
     def edit(self, pid=None):
@@ -845,8 +1105,8 @@ class Video(CDSDeposit):
 
     def _current_tasks_status(self):
         """Return up-to-date tasks status."""
-        return get_tasks_status_by_task(
-            get_deposit_events(self['_deposit']['id']),
+        return get_deposits_tasks_status(
+            [self['_deposit']['id']],
             statuses=deepcopy(self['_deposit'].get('state', {})))
 
     def generate_duration(self):
@@ -903,6 +1163,24 @@ class Video(CDSDeposit):
             db.session.refresh(poster)
 
 
+_deposit_classes_by_host = {}
+
+
+def get_deposit_class(schema):
+    """Get the deposit class of a JSON schema URL, if any.
+
+    The URLs of the schemas of the deposit classes are built only once per
+    process (and schemas host).
+    """
+    host = current_app.config.get('JSONSCHEMAS_HOST')
+    if host not in _deposit_classes_by_host:
+        _deposit_classes_by_host[host] = {
+            current_jsonschemas.path_to_url(deposit_cls._schema): deposit_cls
+            for deposit_cls in (Project, Video)
+        }
+    return _deposit_classes_by_host[host].get(schema)
+
+
 project_resolver = Resolver(
     pid_type='depid', object_type='rec',
     getter=partial(Project.get_record, with_deleted=True)
@@ -928,8 +1206,34 @@ def deposit_video_resolver(video_id):
 
 
 def deposit_videos_resolver(video_ids):
-    """Resolve videos."""
-    return [deposit_video_resolver(id_) for id_ in video_ids]
+    """Resolve videos.
+
+    The registered video deposits are loaded all together, with one query
+    for their PIDs and one for their records. The other ones go through
+    :func:`deposit_video_resolver`, which raises the proper error.
+    """
+    pid_values = [id_ for id_ in video_ids if isinstance(id_, string_types)]
+    uuids = {}
+    if pid_values:
+        uuids = dict(db.session.query(
+            PersistentIdentifier.pid_value, PersistentIdentifier.object_uuid
+        ).filter(
+            PersistentIdentifier.pid_type == video_resolver.pid_type,
+            PersistentIdentifier.object_type == video_resolver.object_type,
+            PersistentIdentifier.status == PIDStatus.REGISTERED,
+            PersistentIdentifier.pid_value.in_(pid_values)
+        ).all())
+    videos = {}
+    if uuids:
+        videos = {video.id: video for video in Video.get_records(
+            list(uuids.values()), with_deleted=True)}
+
+    def resolve(id_):
+        if isinstance(id_, string_types) and uuids.get(id_) in videos:
+            return videos[uuids[id_]]
+        return deposit_video_resolver(id_)
+
+    return [resolve(id_) for id_ in video_ids]
 
 
 def record_video_resolver(video_id):
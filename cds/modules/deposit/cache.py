@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Document Server.
+# Copyright (C) 2017 CERN.
+#
+# CERN Document Server is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Document Server is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Document Server; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cache of the files dump of the deposit buckets."""
+
+from __future__ import absolute_import
+
+from flask import has_app_context
+from invenio_files_rest.models import FileInstance, ObjectVersion, \
+    ObjectVersionTag
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..cache import RevisionedCache
+
+CHANGED_BUCKETS = 'cds_changed_buckets'
+"""Key of the session info holding the buckets changed, but not committed."""
+
+
+class FilesDumpCache(RevisionedCache):
+    """Cache of the files dump of each bucket, backed by Redis.
+
+    Each bucket has a revision counter, incremented every time a transaction
+    changing its objects, their tags or their files is committed. A dump is
+    served from the cache only if it was computed at the current revision,
+    which needs a single ``MGET``.
+
+    Inside a transaction that changed a bucket, the dump is always computed,
+    as the cache can't see the changes until they are committed.
+    """
+
+    redis_url_config = 'CDS_FILES_DUMP_CACHE_REDIS_URL'
+    ttl_config = 'CDS_FILES_DUMP_CACHE_TTL'
+    default_ttl = 24 * 60 * 60
+    prefix = 'cds_files_dump'
+
+    def get(self, bucket_id, dump, session=None):
+        """Get the files dump of a bucket.
+
+        :param bucket_id: the bucket id.
+        :param dump: a function computing the dump, called on cache miss.
+        :param session: the session used to compute the dump.
+        """
+        bucket_id = str(bucket_id)
+        return self.get_many(
+            [bucket_id], lambda bucket_ids: {bucket_id: dump()},
+            session=session)[bucket_id]
+
+    def get_many(self, bucket_ids, dump, session=None):
+        """Get the files dump of some buckets, with a single ``MGET``.
+
+        :param bucket_ids: the bucket ids.
+        :param dump: a function computing the dumps of a list of bucket ids,
+            as a dictionary by bucket id, called with the ones not cached.
+        :param session: the session used to compute the dumps.
+        :returns: a dictionary with the files dump of each bucket by id.
+        """
+        bucket_ids = [str(bucket_id) for bucket_id in bucket_ids]
+        if session is not None and session.autoflush:
+            # as the queries of the dump would do, to track pending changes
+            session.flush()
+        changed = session.info.get(CHANGED_BUCKETS, ()) \
+            if session is not None else ()
+        redis = self._redis()
+        if not redis:
+            return dump(bucket_ids)
+
+        cacheable = [bucket_id for bucket_id in bucket_ids
+                     if bucket_id not in changed]
+        revisions, dumps = self.load_many(redis, cacheable)
+
+        missing = [bucket_id for bucket_id in bucket_ids
+                   if bucket_id not in dumps]
+        if missing:
+            dumps.update(dump(missing))
+            self.store_many(redis, {
+                bucket_id: dumps[bucket_id] for bucket_id in missing
+                if bucket_id in revisions
+            }, revisions)
+        return dumps
+
+
+files_dump_cache = FilesDumpCache()
+"""Cache of the files dump of each bucket."""
+
+
+def mark_buckets_changed(session, bucket_ids):
+    """Mark buckets as changed by the current transaction of a session.
+
+    Their cached files dump is invalidated once the transaction is committed.
+    Changes made through the ORM are tracked automatically, this is needed
+    only for bulk statements.
+    """
+    session.info.setdefault(CHANGED_BUCKETS, set()).update(
+        str(bucket_id) for bucket_id in bucket_ids)
+
+
+def _changed_buckets(session):
+    """Get the buckets whose files dump is changed by a flush."""
+    for obj in set(session.new) | set(session.dirty) | set(session.deleted):
+        if isinstance(obj, ObjectVersion):
+            yield obj.bucket_id
+        elif isinstance(obj, ObjectVersionTag):
+            # if the object version is gone, it's among the deleted objects
+            if obj.object_version is not None:
+                yield obj.object_version.bucket_id
+        elif isinstance(obj, FileInstance) and obj not in session.new:
+            for (bucket_id, ) in session.query(
+                    ObjectVersion.bucket_id).filter(
+                        ObjectVersion.file_id == obj.id):
+                yield bucket_id
+
+
+def _after_flush(session, flush_context):
+    """Collect the buckets changed by a flush."""
+    mark_buckets_changed(session, _changed_buckets(session))
+
+
+def _after_commit(session):
+    """Invalidate the files dump of the buckets changed by a transaction."""
+    bucket_ids = session.info.pop(CHANGED_BUCKETS, None)
+    if bucket_ids and has_app_context():
+        files_dump_cache.invalidate(bucket_ids)
+
+
+def register_listeners():
+    """Track the changes of the buckets on all the sessions."""
+    for identifier, fn in (('after_flush', _after_flush),
+                           ('after_commit', _after_commit)):
+        if not event.contains(Session, identifier, fn):
+            event.listen(Session, identifier, fn)
@@ -29,6 +29,8 @@ from __future__ import absolute_import, print_function
 from invenio_deposit.signals import post_action
 from invenio_indexer.signals import before_record_index
 
+from ..records.cache import register_listeners as register_refs_listeners
+from .cache import register_listeners
 from .receivers import index_deposit_after_publish, \
     datacite_register_after_publish
 from .indexer import cdsdeposit_indexer_receiver
@@ -46,6 +48,10 @@ class CDSDepositApp(object):
         """Flask application initialization."""
         app.extensions['cds-deposit'] = self
         self.register_signals(app)
+        # invalidate the cached files dumps when their buckets change
+        register_listeners()
+        # invalidate the cached references and accesses when they change
+        register_refs_listeners()
 
     @staticmethod
     def register_signals(app):
@@ -26,20 +26,161 @@
 
 from __future__ import absolute_import, print_function
 
-from invenio_jsonschemas import current_jsonschemas
+from functools import partial
 
-from .api import Video, Project
+from flask import current_app
+from invenio_db import db
+from invenio_indexer.api import RecordIndexer
+from invenio_records.models import RecordMetadata
+
+from .api import CDSFilesIterator, Project, Video, get_deposit_class
+from .cache import files_dump_cache
+from ..cache import RedisStore
+from ..webhooks.status import get_deposits_tasks
 
 
 def cdsdeposit_indexer_receiver(
         sender, json=None, record=None, index=None, **dummy_kwargs):
-    """Inject task status information before index."""
-    video_schema = current_jsonschemas.path_to_url(Video._schema)
-    project_schema = current_jsonschemas.path_to_url(Project._schema)
-    if record['$schema'] == project_schema:
-        deposit = Project.get_record(record.id)
-    if record['$schema'] == video_schema:
-        deposit = Video.get_record(record.id)
-    if record['$schema'] in [project_schema, video_schema]:
+    """Inject task status information before index.
+
+    The deposit is built on the record being indexed, without loading it
+    again: its tasks status and files dump come from their caches, filled
+    by :func:`prefetch_deposits` for the records indexed in bulk.
+    """
+    deposit_cls = get_deposit_class(record.get('$schema'))
+    if deposit_cls:
+        deposit = record if isinstance(record, deposit_cls) \
+            else deposit_cls(record, model=record.model)
         json['_deposit']['state'] = deposit['_deposit']['state']
         json['_files'] = deposit['_files']
+
+
+def prefetch_deposits(record_ids):
+    """Precompute the tasks status and the files dump of some deposits.
+
+    The records are loaded with one query, then the tasks of all their
+    videos are stored in the tasks status store and the dumps of all their
+    buckets in the files dump cache, each with batched queries. The records
+    which are not deposits are ignored.
+    """
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+    deposit_ids = []
+    bucket_ids = []
+    for model in RecordMetadata.query.filter(
+            RecordMetadata.id.in_(record_ids)):
+        data = model.json or {}
+        deposit_cls = get_deposit_class(data.get('$schema'))
+        if deposit_cls is Project:
+            deposit_ids.extend(Project(data, model=model).video_ids)
+        elif deposit_cls is Video:
+            deposit_ids.append(data['_deposit']['id'])
+        else:
+            continue
+        if data.get('_buckets', {}).get('deposit'):
+            bucket_ids.append(data['_buckets']['deposit'])
+    if deposit_ids:
+        get_deposits_tasks(deposit_ids)
+    if bucket_ids:
+        files_dump_cache.get_many(
+            bucket_ids,
+            partial(CDSFilesIterator.dump_buckets, file_cls=Video.file_cls),
+            session=db.session())
+
+
+class ReindexQueue(RedisStore):
+    """Debounced queue of the records to reindex, backed by Redis.
+
+    The records scheduled are collected in a Redis set during
+    ``CDS_REINDEX_QUEUE_WINDOW`` seconds, so that a record scheduled many
+    times in the window (i.e. a project updated by each task of each of its
+    videos) is sent only once to the indexer, together with the others, by
+    the ``flush_reindex_queue`` task.
+    """
+
+    redis_url_config = 'CDS_REINDEX_QUEUE_REDIS_URL'
+    prefix = 'cds_reindex_queue'
+
+    pending_key = 'cds_reindex_queue::pending'
+    """Key of the set of the records waiting to be sent to the indexer."""
+
+    flush_key = 'cds_reindex_queue::flush'
+    """Key set while a flush of the queue is scheduled."""
+
+    stats_key = 'cds_reindex_queue::stats'
+    """Key of the hash counting the records scheduled and flushed."""
+
+    def schedule(self, record_ids):
+        """Schedule the reindex of some records."""
+        record_ids = [str(id_) for id_ in record_ids]
+        if not record_ids:
+            return
+        redis = self._redis()
+        if not redis:
+            RecordIndexer().bulk_index(iter(record_ids))
+            return
+        window = current_app.config.get('CDS_REINDEX_QUEUE_WINDOW', 10)
+        pipe = redis.pipeline()
+        pipe.sadd(self.pending_key, *record_ids)
+        pipe.hincrby(self.stats_key, 'scheduled', len(record_ids))
+        # the key expires anyway, in case the flush task gets lost
+        pipe.set(self.flush_key, 1, nx=True, ex=2 * window)
+        _, _, flush = pipe.execute()
+        if flush:
+            from .tasks import flush_reindex_queue
+            flush_reindex_queue.apply_async(countdown=window)
+
+    def flush(self):
+        """Send the records waiting in the queue to the indexer.
+
+        :returns: the number of records sent.
+        """
+        redis = self._redis()
+        if not redis:
+            return 0
+        pipe = redis.pipeline()
+        # records scheduled from now on need another flush
+        pipe.delete(self.flush_key)
+        pipe.smembers(self.pending_key)
+        pipe.delete(self.pending_key)
+        _, record_ids, _ = pipe.execute()
+        if not record_ids:
+            return 0
+        record_ids = [id_.decode('utf-8') for id_ in record_ids]
+        try:
+            prefetch_deposits(record_ids)
+            RecordIndexer().bulk_index(iter(record_ids))
+        except Exception:
+            redis.sadd(self.pending_key, *record_ids)
+            raise
+        pipe = redis.pipeline()
+        pipe.hincrby(self.stats_key, 'flushed', len(record_ids))
+        pipe.hincrby(self.stats_key, 'flushes', 1)
+        pipe.execute()
+        return len(record_ids)
+
+    @property
+    def stats(self):
+        """Depth of the queue and ratio of the duplicates dropped."""
+        redis = self._redis()
+        if not redis:
+            return dict(depth=0, scheduled=0, flushed=0, flushes=0,
+                        dedup_ratio=0.0)
+        pipe = redis.pipeline()
+        pipe.scard(self.pending_key)
+        pipe.hgetall(self.stats_key)
+        depth, counters = pipe.execute()
+        counters = {key.decode('utf-8'): int(value)
+                    for key, value in counters.items()}
+        scheduled = counters.get('scheduled', 0)
+        flushed = counters.get('flushed', 0)
+        return dict(
+            depth=depth, scheduled=scheduled, flushed=flushed,
+            flushes=counters.get('flushes', 0),
+            dedup_ratio=(1 - float(flushed + depth) / scheduled
+                         if scheduled else 0.0))
+
+
+reindex_queue = ReindexQueue()
+"""Process-wide queue of the records to reindex."""
@@ -28,16 +28,22 @@ from __future__ import absolute_import, print_function
 
 import jsonresolver
 
-from .api import deposit_video_resolver, deposit_project_resolver
+from .api import deposit_video_resolver, deposit_project_resolver, \
+    project_resolver, video_resolver
+from ..records.cache import refs_cache
 
 
 @jsonresolver.route('/api/deposits/project/<path:path>', host='cds.cern.ch')
 def deposit_project_jsonresolver(path):
     """Create a nested JSON."""
-    return deposit_project_resolver(path)
+    return refs_cache.resolve(
+        project_resolver.pid_type, path,
+        lambda: deposit_project_resolver(path))
 
 
 @jsonresolver.route('/api/deposits/video/<path:path>', host='cds.cern.ch')
 def deposit_video_jsonresolver(path):
     """Create a nested JSON."""
-    return deposit_video_resolver(path)
+    return refs_cache.resolve(
+        video_resolver.pid_type, path,
+        lambda: deposit_video_resolver(path))
@@ -31,16 +31,14 @@ from invenio_pidstore.models import PersistentIdentifier
 from invenio_indexer.api import RecordIndexer
 from invenio_deposit.receivers import \
     index_deposit_after_publish as original_index_deposit_after_publish
-from invenio_jsonschemas import current_jsonschemas
 
-from .api import Project
+from .api import Project, get_deposit_class
 from .tasks import datacite_register
 
 
 def index_deposit_after_publish(sender, action=None, pid=None, deposit=None):
     """Index the record after publishing."""
-    project_schema = current_jsonschemas.path_to_url(Project._schema)
-    if deposit['$schema'] == project_schema:
+    if get_deposit_class(deposit['$schema']) is Project:
         if action == 'publish':
             # index videos (records)
             pid_values = Project(data=deposit).video_ids
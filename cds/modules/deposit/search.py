@@ -28,12 +28,13 @@ from __future__ import absolute_import, print_function
 from elasticsearch_dsl.query import Q
 from flask import current_app, g, request
 from flask_login import current_user
-from invenio_access.permissions import DynamicPermission, superuser_access
+from invenio_access.permissions import superuser_access
 from invenio_records_rest.errors import InvalidQueryRESTError
 from invenio_search import RecordsSearch
 from invenio_search.api import DefaultFilter
 
-from ..records.utils import get_user_provides
+from ..records.cache import admin_access_cache
+from ..records.utils import get_user_provides_terms
 from .facets import deposit_facets_factory
 
 
@@ -65,11 +66,11 @@ def deposit_search_factory(self, search):
 def cern_filter():
     """Filter list of results."""
     # Send empty query for admins
-    if DynamicPermission(superuser_access).allows(g.identity):
+    if admin_access_cache.allows(superuser_access, g.identity):
         return Q()
 
     # Get CERN user's provides
-    provides = get_user_provides()
+    provides = get_user_provides_terms()
 
     # Filter for restricted records, that the user has access to
     write_restricted = Q('terms', **{'_access.update': provides})
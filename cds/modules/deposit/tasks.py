@@ -32,9 +32,9 @@ from celery import shared_task
 from invenio_records_files.api import Record
 from invenio_pidstore.models import PIDStatus
 from invenio_pidstore.providers.datacite import DataCiteProvider
-from invenio_jsonschemas import current_jsonschemas
 
-from .api import Video, Project
+from .api import Video, Project, get_deposit_class
+from .indexer import reindex_queue
 from .search import AllDraftDepositsSearch
 from ...modules.records.serializers import datacite_v31
 from ...modules.records.minters import is_local_doi
@@ -80,16 +80,15 @@ def _is_state_changed(record, deposit):
 
 def _get_deposits_split_by_type(query):
     """Get video/projects and both as records."""
-    video_schema = current_jsonschemas.path_to_url(Video._schema)
-    project_schema = current_jsonschemas.path_to_url(Project._schema)
     # get list of videos, project and both as records
     video_ids = []
     project_ids = []
     record_ids = []
     for data in query.scan():
-        if data['$schema'] == project_schema:
+        deposit_cls = get_deposit_class(data['$schema'])
+        if deposit_cls is Project:
             project_ids.append(data.meta.id)
-        if data['$schema'] == video_schema:
+        if deposit_cls is Video:
             video_ids.append(data.meta.id)
         record_ids.append(data.meta.id)
     records = {r.id: r for r in Record.get_records(record_ids)}
@@ -112,3 +111,9 @@ def preserve_celery_states_on_db():
         if _is_state_changed(records[project.id], project):
             project.commit()
     db.session.commit()
+
+
+@shared_task(ignore_result=True)
+def flush_reindex_queue():
+    """Send the records waiting in the reindex queue to the indexer."""
+    reindex_queue.flush()
@@ -21,6 +21,7 @@
 
 from __future__ import absolute_import, print_function
 
-from .ffmpeg import ff_frames, ff_probe, ff_probe_all
+from .cache import probe_cache
+from .ffmpeg import ff_frames, ff_gif, ff_probe, ff_probe_all
 
-__all__ = ('ff_frames', 'ff_probe', 'ff_probe_all')
+__all__ = ('ff_frames', 'ff_gif', 'ff_probe', 'ff_probe_all', 'probe_cache')
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Document Server.
+# Copyright (C) 2017 CERN.
+#
+# CERN Document Server is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Document Server is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Document Server; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cache for the metadata extracted with ffprobe."""
+
+from __future__ import absolute_import
+
+import json
+import os
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+
+from flask import current_app
+
+from ..cache import RedisStore
+
+
+class ProbeCache(RedisStore):
+    """LRU cache of parsed ffprobe metadata, with an optional Redis tier.
+
+    Entries are keyed by the checksum of the file, when known, or by its path
+    plus size and modification time, so that a file changed in place is never
+    served stale metadata. Files that are not on the local filesystem (i.e.
+    remote URLs) and have no checksum are not cached.
+    """
+
+    redis_url_config = 'CDS_FFMPEG_PROBE_CACHE_REDIS_URL'
+    ttl_config = 'CDS_FFMPEG_PROBE_CACHE_REDIS_TTL'
+    default_ttl = 24 * 60 * 60
+    prefix = 'cds_ffprobe'
+
+    def __init__(self, maxsize=None):
+        """Init cache."""
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        """Maximum number of entries kept in memory."""
+        if self._maxsize is not None:
+            return self._maxsize
+        return current_app.config.get('CDS_FFMPEG_PROBE_CACHE_SIZE', 128)
+
+    @staticmethod
+    def make_key(input_filename, checksum=None):
+        """Build the cache key of a file, or ``None`` if it can't be cached."""
+        if checksum:
+            return 'checksum:{0}'.format(checksum)
+        try:
+            stat = os.stat(input_filename)
+        except (OSError, TypeError):
+            return None
+        return 'file:{0}:{1}:{2}'.format(
+            input_filename, stat.st_size, stat.st_mtime)
+
+    def get(self, key):
+        """Get the metadata stored under ``key`` or ``None``."""
+        with self._lock:
+            if key in self._entries:
+                value = self._entries.pop(key)
+                self._entries[key] = value
+                self.hits += 1
+                return deepcopy(value)
+
+        redis = self._redis()
+        cached = redis.get(self._redis_key(key)) if redis else None
+        if cached is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        value = json.loads(cached.decode('utf-8'))
+        self._set_local(key, value)
+        with self._lock:
+            self.hits += 1
+        return deepcopy(value)
+
+    def set(self, key, value):
+        """Store the metadata of a file under ``key``."""
+        self._set_local(key, deepcopy(value))
+        redis = self._redis()
+        if redis:
+            redis.setex(self._redis_key(key), self.ttl, json.dumps(value))
+
+    def _set_local(self, key, value):
+        """Store an entry in memory, evicting the least recently used."""
+        maxsize = self.maxsize
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empty the in-memory tier and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self):
+        """Hit/miss counters and current size of the in-memory tier."""
+        return dict(hits=self.hits, misses=self.misses,
+                    size=len(self._entries))
+
+
+probe_cache = ProbeCache()
+"""Process-wide ffprobe metadata cache."""
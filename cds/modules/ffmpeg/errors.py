@@ -60,3 +60,7 @@ class MetadataExtractionExecutionError(FFmpegExecutionError):
 
 class FrameExtractionExecutionError(FFmpegExecutionError):
     """Raised when there is an execution error of a ff_frames subprocess."""
+
+
+class GifExtractionExecutionError(FFmpegExecutionError):
+    """Raised when there is an execution error of a ff_gif subprocess."""
@@ -27,37 +27,39 @@
 from __future__ import absolute_import
 
 import json
+import os
+from functools import partial
 from itertools import count, takewhile
-from subprocess import STDOUT, CalledProcessError, check_output
+from multiprocessing.pool import ThreadPool
+from subprocess import PIPE, STDOUT, CalledProcessError, Popen
+from threading import Lock, Timer
 
 from cds_sorenson.api import get_available_aspect_ratios
 from flask import current_app
 
+from .cache import probe_cache
 from .errors import FrameExtractionInvalidArguments, FFmpegExecutionError, \
-    MetadataExtractionExecutionError, FrameExtractionExecutionError
+    MetadataExtractionExecutionError, FrameExtractionExecutionError, \
+    GifExtractionExecutionError
 
 
-def ff_probe(input_filename, field):
-    """Retrieve requested field from the output of ffprobe.
+def ff_probe(input_filename, field, checksum=None):
+    """Retrieve requested field of the video stream.
 
-    **OPTIONS**
-
-    * *-v error* show all errors
-    * *-select_streams v:0* select only video stream
-    * *-show_entries stream=<field>* show only requested field
-    * *-of default=noprint_wrappers=1:nokey=1* extract only values
+    The value is read from the (cached) output of :func:`ff_probe_all` and
+    returned in the same format as plain ``ffprobe``, i.e. as bytes, or an
+    empty value if the stream does not have such field.
     """
     if field == 'display_aspect_ratio':
-        return probe_aspect_ratio(input_filename)
+        return probe_aspect_ratio(input_filename, checksum=checksum)
 
-    return run_command(
-        'ffprobe -v error -select_streams v:0 -show_entries stream={0} -of '
-        'default=noprint_wrappers=1:nokey=1 {1}'.format(field, input_filename),
-        error_class=MetadataExtractionExecutionError
-    ).rstrip()
+    streams = _probe_all(input_filename, checksum=checksum).get('streams')
+    # Inputs without video stream have no value for any field
+    value = streams[0].get(field) if streams else None
+    return u'{0}'.format(value).encode('utf-8') if value is not None else b''
 
 
-def ff_probe_all(input_filename):
+def ff_probe_all(input_filename, checksum=None):
     """Retrieve all video metadata from the output of ffprobe.
 
     **OPTIONS**
@@ -65,23 +67,35 @@ def ff_probe_all(input_filename):
     * *-v error* show all errors
     * *-show_format -print_format json* output in JSON format
     * *-show_streams -select_streams v:0* show information for video streams
+
+    :param checksum: checksum of the file (i.e. ``FileInstance.checksum``),
+        used to look up the metadata in the probe cache.
     """
-    metadata = run_command(
-        'ffprobe -v error -show_format -print_format json -show_streams '
-        '-select_streams v:0 {0}'.format(input_filename),
-        error_class=MetadataExtractionExecutionError
-    ).decode('utf-8')
+    return json.dumps(_probe_all(input_filename, checksum=checksum))
+
 
-    return _patch_aspect_ratio(metadata)
+def _probe_all(input_filename, checksum=None):
+    """Get the parsed ffprobe metadata, reading through the probe cache."""
+    key = probe_cache.make_key(input_filename, checksum=checksum)
+    metadata = probe_cache.get(key) if key else None
+    if metadata is None:
+        metadata = _patch_aspect_ratio(json.loads(run_command(
+            'ffprobe -v error -show_format -print_format json -show_streams '
+            '-select_streams v:0 {0}'.format(input_filename),
+            error_class=MetadataExtractionExecutionError
+        ).decode('utf-8')))
+        if key:
+            probe_cache.set(key, metadata)
+    return metadata
 
 
 #
 # Aspect Ratio  # TODO remove when Sorenson is updated
 #
-def probe_aspect_ratio(input_filename):
+def probe_aspect_ratio(input_filename, checksum=None):
     """Probe video's aspect ratio, calculating it if needed."""
-    metadata = ff_probe_all(input_filename)
-    return json.loads(metadata)['streams'][0]['display_aspect_ratio']
+    metadata = _probe_all(input_filename, checksum=checksum)
+    return metadata['streams'][0]['display_aspect_ratio']
 
 
 def _calculate_aspect_ratio(width, height):
@@ -94,21 +108,22 @@ def _calculate_aspect_ratio(width, height):
                        'aspect ratio.')
 
 
-def _patch_aspect_ratio(metadata):
+def _patch_aspect_ratio(info):
     """Replace invalid aspect ratio(i.e. '0:1') with calculated one."""
-    info = json.loads(metadata)
+    if not info.get('streams'):
+        return info
     sinfo = info['streams'][0]
     key = 'display_aspect_ratio'
     if sinfo[key] == '0:1':
         sinfo[key] = _calculate_aspect_ratio(sinfo['width'], sinfo['height'])
-    return json.dumps(info)
+    return info
 
 
 #
 # Frame extraction
 #
 def ff_frames(input_file, start, end, step, duration, output,
-              progress_callback=None):
+              progress_callback=None, single_pass=None):
     """Extract requested frames from video.
 
     :param input_file: the input video file
@@ -120,6 +135,9 @@ def ff_frames(input_file, start, end, step, duration, output,
     string templates (i.e /path/to/somewhere/frames-{:02d}.jpg)
     :param progress_callback: function taking as parameter the index of the
     currently processed frame
+    :param single_pass: extract all the frames with a single ``ffmpeg``
+    process, instead of one process per frame (defaults to
+    ``CDS_FFMPEG_FRAMES_SINGLE_PASS``)
     :raises subprocess.CalledProcessError: if any error occurs in the execution
     of the ``ffmpeg`` command
     """
@@ -128,31 +146,189 @@ def ff_frames(input_file, start, end, step, duration, output,
                 start < end, (end - start) % step < 0.05]):
         raise FrameExtractionInvalidArguments()
 
-    # Iterate over requested timestamps
-    timestamps = takewhile(lambda t: t <= end, count(start, step))
-    for i, timestamp in enumerate(timestamps):
-        # Construct ffmpeg command
-        cmd = 'ffmpeg -accurate_seek -ss {0} -i {1} -vframes 1 {2}'.format(
-            timestamp, input_file, output.format(i + 1))
+    if single_pass is None:
+        single_pass = current_app.config.get(
+            'CDS_FFMPEG_FRAMES_SINGLE_PASS', True)
+    progress_callback = progress_callback or (lambda i: None)
+
+    # Requested timestamps
+    timestamps = list(takewhile(lambda t: t <= end, count(start, step)))
+
+    if single_pass:
+        _ff_frames_single_pass(input_file, timestamps, output,
+                               progress_callback)
+    else:
+        _ff_frames_parallel(input_file, timestamps, output, progress_callback)
+
+
+def _ff_frame_command(input_file, timestamp, output_file):
+    """Build the command extracting a single frame at the given timestamp."""
+    cmd = 'ffmpeg -accurate_seek -ss {0} -i {1} -vframes 1 {2}'.format(
+        timestamp, input_file, output_file)
+    return _eos_command(cmd)
+
 
-        # Wrap command with EOS environment
-        if current_app.config.get('USE_EOS', False):
-            cmd = 'bash -c "eosfusebind && {}"'.format(cmd)
+def _ff_frame(input_file, timestamp, output_file):
+    """Extract a single frame, seeking accurately to the given timestamp."""
+    run_command(_ff_frame_command(input_file, timestamp, output_file),
+                error_class=FrameExtractionExecutionError,
+                timeout=current_app.config.get('CDS_FFMPEG_FRAME_TIMEOUT'))
 
-        # Run ffmpeg command
-        run_command(cmd, error_class=FrameExtractionExecutionError)
 
+def _ff_frames_parallel(input_file, timestamps, output, progress_callback):
+    """Extract each frame with its own ``ffmpeg`` process, concurrently.
+
+    At most ``CDS_FFMPEG_MAX_PARALLEL`` processes run at the same time and
+    each of them is killed after ``CDS_FFMPEG_FRAME_TIMEOUT`` seconds. Results
+    are consumed in timestamp order, so progress is always reported as
+    ``1, 2, ..., n`` regardless of which process finishes first.
+    """
+    # Commands are built here, since the pool threads have no app context
+    commands = [_ff_frame_command(input_file, timestamp, output.format(i + 1))
+                for i, timestamp in enumerate(timestamps)]
+    running = _RunningProcesses()
+    extract = partial(
+        run_command, error_class=FrameExtractionExecutionError,
+        timeout=current_app.config.get('CDS_FFMPEG_FRAME_TIMEOUT'),
+        running=running)
+    processes = min(
+        current_app.config.get('CDS_FFMPEG_MAX_PARALLEL', 1), len(commands))
+
+    pool = ThreadPool(processes=max(processes, 1))
+    try:
+        for i, _ in enumerate(pool.imap(extract, commands)):
+            # Report progress
+            progress_callback(i + 1)
+    finally:
+        # Kill the processes still running (i.e. on error), since terminating
+        # the pool waits for its threads
+        running.kill_all()
+        pool.terminate()
+
+
+def _ff_frames_single_pass(input_file, timestamps, output,
+                           progress_callback):
+    """Extract all the frames with one ``ffmpeg`` process.
+
+    The video is opened once per frame, each time seeking accurately to its
+    timestamp (``-ss`` before ``-i``), and each input is mapped to its own
+    single-frame output. Only the frames around each timestamp are decoded,
+    as with one process per frame, without paying for the start-up of
+    several processes. Frames that could not be written (i.e. too close to
+    the end of the video) are extracted one by one.
+    """
+    inputs = ' '.join('-accurate_seek -ss {0} -i {1}'.format(
+        timestamp, input_file) for timestamp in timestamps)
+    outputs = ' '.join('-map {0}:v -frames:v 1 {1}'.format(
+        i, output.format(i + 1)) for i in range(len(timestamps)))
+    run_command(_eos_command('ffmpeg {0} {1}'.format(inputs, outputs)),
+                error_class=FrameExtractionExecutionError,
+                timeout=current_app.config.get('CDS_FFMPEG_FRAME_TIMEOUT'))
+
+    for i, timestamp in enumerate(timestamps):
+        if not os.path.exists(output.format(i + 1)):
+            _ff_frame(input_file, timestamp, output.format(i + 1))
         # Report progress
         progress_callback(i + 1)
 
 
+def _eos_command(cmd):
+    """Wrap command with EOS environment, if needed."""
+    if current_app.config.get('USE_EOS', False):
+        cmd = 'bash -c "eosfusebind && {}"'.format(cmd)
+    return cmd
+
+
+#
+# GIF generation
+#
+def ff_gif(input_pattern, output, width, frame_duration=0.5):
+    """Create an animated GIF out of a sequence of images.
+
+    The frames are downscaled and streamed through ``palettegen``, which
+    computes a single palette for the whole GIF, and ``paletteuse``, which
+    applies it to each frame as it is appended to the output.
+
+    :param input_pattern: the input images as in ``ffmpeg`` image sequences
+    (i.e /path/to/somewhere/frame-%d.jpg)
+    :param output: the output GIF file
+    :param width: maximum width of the GIF, the aspect ratio is kept
+    :param frame_duration: time in seconds each frame is displayed
+    """
+    cmd = ('ffmpeg -framerate {0} -i {1} -filter_complex '
+           'scale=min({2}\\,iw):-1,split[a][b];[a]palettegen[p];'
+           '[b][p]paletteuse -loop 0 {3}').format(
+               1 / float(frame_duration), input_pattern, width, output)
+    run_command(cmd, error_class=GifExtractionExecutionError)
+
+
 #
 # Subprocess wrapper
 #
-def run_command(command, error_class=FFmpegExecutionError, **kwargs):
-    """Run ffmpeg command and capture errors."""
+class _RunningProcesses(object):
+    """Processes started by several threads, to kill them all at once."""
+
+    def __init__(self):
+        """Init the set of running processes."""
+        self._lock = Lock()
+        self._processes = set()
+        self._killed = False
+
+    def add(self, process):
+        """Track a process, killing it if all the processes were killed."""
+        with self._lock:
+            if self._killed:
+                _kill(process)
+            else:
+                self._processes.add(process)
+
+    def discard(self, process):
+        """Stop tracking a process."""
+        with self._lock:
+            self._processes.discard(process)
+
+    def kill_all(self):
+        """Kill the running processes and the ones started afterwards."""
+        with self._lock:
+            self._killed = True
+            for process in self._processes:
+                _kill(process)
+            self._processes.clear()
+
+
+def _kill(process):
+    """Kill a process, unless it already exited."""
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+
+def run_command(command, error_class=FFmpegExecutionError, timeout=None,
+                running=None, **kwargs):
+    """Run ffmpeg command and capture errors.
+
+    :param timeout: seconds after which the process gets killed, in which case
+        ``error_class`` is raised as for any other failure.
+    :param running: the :class:`_RunningProcesses` tracking the process while
+        it runs, if any.
+    """
     kwargs.setdefault('stderr', STDOUT)
+    args = command.split()
+    process = Popen(args, stdout=PIPE, **kwargs)
+    if running is not None:
+        running.add(process)
+    timer = Timer(timeout, process.kill) if timeout else None
+    if timer:
+        timer.start()
     try:
-        return check_output(command.split(), **kwargs)
-    except CalledProcessError as e:
-        raise error_class(e)
+        output, _ = process.communicate()
+    finally:
+        if timer:
+            timer.cancel()
+        if running is not None:
+            running.discard(process)
+    if process.returncode:
+        raise error_class(CalledProcessError(
+            process.returncode, args, output=output))
+    return output
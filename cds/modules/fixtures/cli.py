@@ -40,7 +40,7 @@ from flask import current_app
 from flask.cli import with_appcontext
 from invenio_db import db
 from invenio_files_rest.models import (Bucket, FileInstance, Location,
-                                       ObjectVersion, ObjectVersionTag)
+                                       ObjectVersion)
 from invenio_indexer.api import RecordIndexer
 from invenio_opendefinition.tasks import (harvest_licenses,
                                           import_licenses_from_json)
@@ -53,6 +53,7 @@ from invenio_records_files.models import RecordsBuckets
 from invenio_sequencegenerator.api import Template
 
 from ..records.tasks import keywords_harvesting
+from ..webhooks.tasks import create_tags as create_object_tags
 from .video_utils import add_master_to_video
 
 
@@ -382,7 +383,7 @@ def videos(video, frames, temp, video_count):
     """Load videos, frames and subformats."""
     def create_tags(video_obj, **tags):
         """Create multiple tags for a single object version."""
-        [ObjectVersionTag.create(video_obj, tag, tags[tag]) for tag in tags]
+        create_object_tags(video_obj, tags)
 
     with current_app.wsgi_app.mounts['/api'].app_context():
         if not video:
@@ -21,12 +21,14 @@
 
 from __future__ import absolute_import, print_function
 
-from invenio_files_rest.models import ObjectVersion, ObjectVersionTag, Bucket
+from invenio_files_rest.models import ObjectVersion, Bucket
+
+from ..webhooks.tasks import create_tags
 
 
 def _create_tags(video_obj, **tags):
     """Create multiple tags for a single object version."""
-    [ObjectVersionTag.create(video_obj, tag, tags[tag]) for tag in tags]
+    create_tags(video_obj, tags)
 
 
 def add_master_to_video(video_deposit, filename, stream, video_duration):
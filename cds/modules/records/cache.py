@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Document Server.
+# Copyright (C) 2017 CERN.
+#
+# CERN Document Server is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Document Server is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Document Server; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+
+"""Caches of the records the ``$ref``s resolve to and of the accesses."""
+
+from __future__ import absolute_import
+
+import copy
+import hashlib
+import json
+
+from flask import g, has_app_context, has_request_context
+from invenio_access import DynamicPermission
+from invenio_access.models import ActionNeedMixin
+from invenio_accounts.models import Role
+from invenio_db import db
+from invenio_records.signals import after_record_delete, \
+    after_record_insert, after_record_update
+from invenio_records_files.models import RecordsBuckets
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..cache import RevisionedCache
+
+CHANGED_REFS = 'cds_changed_refs'
+"""Key of the session info holding the references changed, not committed."""
+
+CHANGED_RECORDS = 'cds_changed_records'
+"""Key of the session info holding the records changed, not flushed yet."""
+
+CHANGED_BUCKETS_ACCESS = 'cds_changed_buckets_access'
+"""Key of the session info holding the buckets whose access changed."""
+
+CHANGED_ACCESS_ACTIONS = 'cds_changed_access_actions'
+"""Key of the session info flagging that the access actions changed."""
+
+
+class RefsCache(RevisionedCache):
+    """Two tiers cache of the records the ``$ref``s resolve to.
+
+    Each reference, identified by its PID, is resolved only once per request
+    and kept in a memo on :data:`flask.g`. The records that are not deposits
+    are also shared between requests through Redis for
+    ``CDS_REFS_CACHE_TTL`` seconds, validated against a revision counter
+    incremented every time a transaction creating, updating or deleting the
+    record is committed.
+
+    Inside a transaction that updated a record, its references are always
+    resolved from the database.
+
+    Each caller gets its own copy of the record, which it can change without
+    changing what the next callers get.
+    """
+
+    redis_url_config = 'CDS_REFS_CACHE_REDIS_URL'
+    ttl_config = 'CDS_REFS_CACHE_TTL'
+    prefix = 'cds_refs'
+
+    memo_attr = 'cds_refs_memo'
+    """Attribute of :data:`flask.g` holding the references of the request."""
+
+    @staticmethod
+    def _key(pid_type, pid_value):
+        """Build the key of a reference."""
+        return '{0}::{1}'.format(pid_type, pid_value)
+
+    def _memo(self):
+        """Get the memo of the current request, if any."""
+        if not has_request_context():
+            return None
+        if not hasattr(g, self.memo_attr):
+            setattr(g, self.memo_attr, {})
+        return getattr(g, self.memo_attr)
+
+    def resolve(self, pid_type, pid_value, resolve, record_cls=None):
+        """Resolve a reference.
+
+        :param pid_type: the type of the PID of the reference.
+        :param pid_value: the value of the PID of the reference.
+        :param resolve: a function resolving the reference, called on miss.
+        :param record_cls: the class of the record, to keep it in the shared
+            tier too. By default the record is memoized only.
+        """
+        key = self._key(pid_type, pid_value)
+        memo = self._memo()
+        if memo is not None and key in memo:
+            return self._copy(memo[key])
+
+        redis = self._redis() if record_cls is not None else None
+        if redis and key in db.session.info.get(CHANGED_REFS, ()):
+            redis = None
+        if redis:
+            revisions, cached = self.load_many(redis, [key])
+            if key in cached:
+                record = record_cls(cached[key])
+            else:
+                record = resolve()
+                self.store_many(redis, {key: record}, revisions)
+        else:
+            record = resolve()
+
+        if memo is not None:
+            memo[key] = record
+            return self._copy(record)
+        return record
+
+    @staticmethod
+    def _copy(record):
+        """Copy a record memoized, sharing only its model."""
+        model = getattr(record, 'model', None)
+        return copy.deepcopy(record, {id(model): model})
+
+    @staticmethod
+    def keys_of(record):
+        """Get the keys of the references a record is resolved by."""
+        keys = []
+        if record.get('recid') is not None:
+            keys.append(RefsCache._key('recid', record['recid']))
+        if record.get('key_id') is not None:
+            keys.append(RefsCache._key('kwid', record['key_id']))
+        if (record.get('_deposit') or {}).get('id') is not None:
+            keys.append(RefsCache._key('depid', record['_deposit']['id']))
+        return keys
+
+    def forget(self, keys):
+        """Remove some references from the memo of the current request."""
+        memo = self._memo()
+        if memo:
+            for key in keys:
+                memo.pop(key, None)
+
+
+refs_cache = RefsCache()
+"""Cache of the records the ``$ref``s resolve to."""
+
+
+class BucketAccessCache(RevisionedCache):
+    """Cache of what the permissions on the files of a bucket depend on.
+
+    The access of each bucket (i.e. the kind of its record and the fields
+    checked by the permissions) is kept in Redis for
+    ``CDS_BUCKET_ACCESS_CACHE_TTL`` seconds, validated against a revision
+    counter incremented every time a transaction changing the record of the
+    bucket, or linking the bucket to a record, is committed.
+
+    Inside a transaction that changed a record or a link, the access is always
+    read from the database.
+    """
+
+    redis_url_config = 'CDS_BUCKET_ACCESS_CACHE_REDIS_URL'
+    ttl_config = 'CDS_BUCKET_ACCESS_CACHE_TTL'
+    default_ttl = 60
+    prefix = 'cds_bucket_access'
+
+    def get(self, bucket_id, load):
+        """Get the access of a bucket.
+
+        :param bucket_id: the bucket id.
+        :param load: a function loading the access of a bucket given its id,
+            called on cache miss. If it returns ``None``, nothing is cached.
+        """
+        bucket_id = str(bucket_id)
+        redis = self._redis()
+        info = db.session.info
+        if not redis or info.get(CHANGED_RECORDS) or \
+                bucket_id in info.get(CHANGED_BUCKETS_ACCESS, ()):
+            return load(bucket_id)
+
+        revisions, cached = self.load_many(redis, [bucket_id])
+        if bucket_id in cached:
+            return cached[bucket_id]
+
+        access = load(bucket_id)
+        if access is not None:
+            self.store_many(redis, {bucket_id: access}, revisions)
+        return access
+
+
+bucket_access_cache = BucketAccessCache()
+"""Cache of the access of each bucket."""
+
+
+class AdminAccessCache(RevisionedCache):
+    """Cache of the admin capabilities of the identities.
+
+    Whether an identity is allowed an action (e.g. the admin or the superuser
+    access) is checked only once per request and kept in a memo on
+    :data:`flask.g`. It is also shared between requests through Redis for
+    ``CDS_ADMIN_ACCESS_CACHE_TTL`` seconds, keyed by the needs the identity
+    provides and validated against a revision counter incremented every time
+    a transaction changing the actions of the users and roles is committed.
+
+    Inside a transaction that changed the actions, the access is always
+    checked from the database.
+    """
+
+    redis_url_config = 'CDS_ADMIN_ACCESS_CACHE_REDIS_URL'
+    ttl_config = 'CDS_ADMIN_ACCESS_CACHE_TTL'
+    default_ttl = 60
+    prefix = 'cds_admin_access'
+
+    memo_attr = 'cds_admin_access_memo'
+    """Attribute of :data:`flask.g` holding the accesses of the request."""
+
+    @staticmethod
+    def _access_key(action, provides):
+        """Build the key of the access of some needs to an action."""
+        needs = sorted(json.dumps(list(need), default=str)
+                       for need in provides)
+        digest = hashlib.sha1(json.dumps(needs).encode('utf-8')).hexdigest()
+        return '{0}::{1}'.format(action.value, digest)
+
+    def _revision_key(self, key):
+        """Get the key of the revision counter, shared by all the accesses."""
+        return '{0}_revision'.format(self.prefix)
+
+    def _memo(self):
+        """Get the memo of the current request, if any."""
+        if not has_request_context():
+            return None
+        if not hasattr(g, self.memo_attr):
+            setattr(g, self.memo_attr, {})
+        return getattr(g, self.memo_attr)
+
+    def allows(self, action, identity):
+        """Check if an identity is allowed an action.
+
+        :param action: the action need (e.g. ``superuser_access``).
+        :param identity: the identity.
+        """
+        if db.session.info.get(CHANGED_ACCESS_ACTIONS):
+            return DynamicPermission(action).allows(identity)
+
+        provides = frozenset(identity.provides)
+        memo = self._memo()
+        if memo is not None and (action, provides) in memo:
+            return memo[(action, provides)]
+
+        redis = self._redis()
+        if redis:
+            key = self._access_key(action, provides)
+            revisions, cached = self.load_many(redis, [key])
+            if key in cached:
+                allowed = cached[key]
+            else:
+                allowed = DynamicPermission(action).allows(identity)
+                self.store_many(redis, {key: allowed}, revisions)
+        else:
+            allowed = DynamicPermission(action).allows(identity)
+
+        if memo is not None:
+            memo[(action, provides)] = allowed
+        return allowed
+
+    def forget(self):
+        """Empty the memo of the current request."""
+        if has_request_context():
+            g.pop(self.memo_attr, None)
+
+    def invalidate(self):
+        """Invalidate the accesses in the shared tier."""
+        redis = self._redis()
+        if redis:
+            redis.incr(self._revision_key(None))
+
+
+admin_access_cache = AdminAccessCache()
+"""Cache of the admin capabilities of the identities."""
+
+
+def _mark_buckets_access_changed(session, bucket_ids):
+    """Mark the access of some buckets as changed by a transaction."""
+    session.info.setdefault(CHANGED_BUCKETS_ACCESS, set()).update(
+        str(bucket_id) for bucket_id in bucket_ids)
+
+
+def _record_changed(sender, record=None, **kwargs):
+    """Forget a record changed, and invalidate it once committed."""
+    keys = refs_cache.keys_of(record)
+    refs_cache.forget(keys)
+    db.session.info.setdefault(CHANGED_REFS, set()).update(keys)
+    db.session.info.setdefault(CHANGED_RECORDS, set()).add(str(record.id))
+
+
+def _after_flush(session, flush_context):
+    """Collect the buckets linked or unlinked and the actions changed."""
+    _mark_buckets_access_changed(session, [
+        obj.bucket_id for obj in set(session.new) | set(session.deleted)
+        if isinstance(obj, RecordsBuckets)
+    ])
+    if any(isinstance(obj, (ActionNeedMixin, Role)) for obj in
+           set(session.new) | set(session.dirty) | set(session.deleted)):
+        session.info[CHANGED_ACCESS_ACTIONS] = True
+        admin_access_cache.forget()
+
+
+def _before_commit(session):
+    """Collect the buckets of the records changed by a transaction."""
+    record_ids = session.info.pop(CHANGED_RECORDS, None)
+    if record_ids and has_app_context() and bucket_access_cache._redis():
+        _mark_buckets_access_changed(session, [
+            bucket_id for (bucket_id, ) in session.query(
+                RecordsBuckets.bucket_id).filter(
+                    RecordsBuckets.record_id.in_(list(record_ids)))
+        ])
+
+
+def _after_commit(session):
+    """Invalidate the references, buckets and actions changed."""
+    keys = session.info.pop(CHANGED_REFS, None)
+    bucket_ids = session.info.pop(CHANGED_BUCKETS_ACCESS, None)
+    actions_changed = session.info.pop(CHANGED_ACCESS_ACTIONS, None)
+    if has_app_context():
+        if keys:
+            refs_cache.invalidate(keys)
+        if bucket_ids:
+            bucket_access_cache.invalidate(bucket_ids)
+        if actions_changed:
+            admin_access_cache.invalidate()
+
+
+def register_listeners():
+    """Track the changes of the records, their buckets and the actions."""
+    for signal in (after_record_insert, after_record_update,
+                   after_record_delete):
+        signal.connect(_record_changed, weak=False)
+    for identifier, fn in (('after_flush', _after_flush),
+                           ('before_commit', _before_commit),
+                           ('after_commit', _after_commit)):
+        if not event.contains(Session, identifier, fn):
+            event.listen(Session, identifier, fn)
@@ -28,11 +28,14 @@ from __future__ import absolute_import, print_function
 
 import jsonresolver
 
+from ..api import Keyword
+from ..cache import refs_cache
 from ..resolver import keyword_resolver
 
 
 @jsonresolver.route('/api/keywords/<path:path>', host='cds.cern.ch')
 def keyword_jsonresolver(path):
     """Create a nested JSON."""
-    _, kw = keyword_resolver.resolve(path)
-    return kw
+    return refs_cache.resolve(
+        keyword_resolver.pid_type, path,
+        lambda: keyword_resolver.resolve(path)[1], record_cls=Keyword)
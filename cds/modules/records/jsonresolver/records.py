@@ -27,12 +27,15 @@
 from __future__ import absolute_import, print_function
 
 import jsonresolver
+from invenio_records_files.api import Record
 
+from ..cache import refs_cache
 from ..resolver import record_resolver
 
 
 @jsonresolver.route('/api/record/<path:path>', host='cds.cern.ch')
 def record_jsonresolver(path):
     """Create a nested JSON."""
-    _, record = record_resolver.resolve(path)
-    return record
+    return refs_cache.resolve(
+        record_resolver.pid_type, path,
+        lambda: record_resolver.resolve(path)[1], record_cls=Record)
@@ -24,14 +24,15 @@
 
 from __future__ import absolute_import, print_function
 
+from flask import g
 from flask_security import current_user
-from invenio_access import DynamicPermission
 from invenio_files_rest.models import Bucket, MultipartObject, ObjectVersion
 from invenio_records.api import Record
 from invenio_records_files.api import FileObject
 from invenio_records_files.models import RecordsBuckets
 from invenio_deposit.permissions import action_admin_access
 
+from .cache import admin_access_cache, bucket_access_cache
 from .utils import is_deposit, is_record, get_user_provides
 
 
@@ -54,18 +55,42 @@ def files_permission_factory(obj, action=None):
     elif isinstance(obj, FileObject):
         bucket_id = str(obj.bucket_id)
 
-    # Retrieve record
+    # Retrieve record access
     if bucket_id is not None:
         # Record or deposit bucket
-        rb = RecordsBuckets.query.filter_by(bucket_id=bucket_id).one_or_none()
-        if rb is not None:
-            record = Record.get_record(rb.record_id)
-            if is_record(record):
-                return RecordFilesPermission.create(record, action)
-            elif is_deposit(record):
-                return DepositFilesPermission.create(record, action)
+        access = bucket_access_cache.get(bucket_id, get_bucket_access)
+        if access is not None:
+            if access['kind'] == 'record':
+                return RecordFilesPermission.create(access['record'], action)
+            elif access['kind'] == 'deposit':
+                return DepositFilesPermission.create(access['record'], action)
 
-    return DynamicPermission(action_admin_access).can()
+    return has_admin_permission()
+
+
+def get_bucket_access(bucket_id):
+    """Get what the permissions on the files of a bucket depend on.
+
+    :returns: the id and the kind (``'record'``, ``'deposit'`` or ``None``)
+        of the record of the bucket, with a snapshot of its fields checked
+        by the permissions, or ``None`` if the bucket has no record.
+    """
+    rb = RecordsBuckets.query.filter_by(bucket_id=bucket_id).one_or_none()
+    if rb is None:
+        return None
+    record = Record.get_record(rb.record_id)
+    kind = None
+    if is_record(record):
+        kind = 'record'
+    elif is_deposit(record):
+        kind = 'deposit'
+    snapshot = {}
+    if '_access' in record:
+        snapshot['_access'] = record['_access']
+    if 'created_by' in (record.get('_deposit') or {}):
+        snapshot['_deposit'] = dict(
+            created_by=record['_deposit']['created_by'])
+    return dict(record_id=str(record.id), kind=kind, record=snapshot)
 
 
 def record_permission_factory(record=None, action=None):
@@ -289,7 +314,7 @@ def has_read_files_permission(user, record):
     user_provides = get_user_provides()
     read_access_groups = record['_access']['read-files']
 
-    if not set(user_provides).isdisjoint(set(read_access_groups)):
+    if not user_provides.isdisjoint(read_access_groups):
         return True
 
     return has_admin_permission(user, record)
@@ -305,7 +330,7 @@ def has_read_record_permission(user, record):
     user_provides = get_user_provides()
     read_access_groups = record['_access']['read']
 
-    if not set(user_provides).isdisjoint(set(read_access_groups)):
+    if not user_provides.isdisjoint(read_access_groups):
         return True
 
     return has_admin_permission()
@@ -324,7 +349,7 @@ def has_update_permission(user, record):
     user_provides = get_user_provides()
     # set.isdisjoint() is faster than set.intersection()
     allowed_users = record.get('_access', {}).get('update', [])
-    if allowed_users and not set(user_provides).isdisjoint(set(allowed_users)):
+    if allowed_users and not user_provides.isdisjoint(allowed_users):
         return True
 
     return has_admin_permission()
@@ -337,4 +362,4 @@ def has_admin_permission(user=None, record=None):
     to allow for dynamic dispatch.
     """
     # Allow administrators
-    return DynamicPermission(action_admin_access).can()
+    return admin_access_cache.allows(action_admin_access, g.identity)
@@ -29,23 +29,24 @@ from __future__ import absolute_import, print_function
 from elasticsearch_dsl.query import Q
 from flask import g
 from flask_login import current_user
-from invenio_access.permissions import DynamicPermission, superuser_access
+from invenio_access.permissions import superuser_access
 from invenio_search import RecordsSearch
 from invenio_search.api import DefaultFilter
 from invenio_search.utils import schema_to_index
 
-from .utils import get_user_provides
+from .cache import admin_access_cache
+from .utils import get_user_provides_terms
 from .api import Keyword
 
 
 def cern_filter():
     """Filter list of results."""
     # Send empty query for admins
-    if DynamicPermission(superuser_access).allows(g.identity):
+    if admin_access_cache.allows(superuser_access, g.identity):
         return Q()
 
     # Get CERN user's provides
-    provides = get_user_provides()
+    provides = get_user_provides_terms()
 
     # Filter for public records
     public = Q('missing', field='_access.read')
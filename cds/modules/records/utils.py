@@ -31,13 +31,31 @@ from invenio_search import current_search
 from invenio_search.utils import schema_to_index
 
 
+_schemas_indices = {}
+
+
+def schema_index(schema):
+    """Get the index, the document type and the index prefix of a schema.
+
+    The schemas and the indices don't change, so they are computed only once
+    per process for each schema.
+    """
+    try:
+        return _schemas_indices[schema]
+    except KeyError:
+        pass
+    index, doctype = schema_to_index(
+        schema, index_names=current_search.mappings.keys())
+    _schemas_indices[schema] = (
+        index, doctype, index.split('-')[0] if index else None)
+    return _schemas_indices[schema]
+
+
 def schema_prefix(schema):
     """Get index prefix for a given schema."""
     if not schema:
         return None
-    index, doctype = schema_to_index(
-        schema, index_names=current_search.mappings.keys())
-    return index.split('-')[0]
+    return schema_index(schema)[2]
 
 
 def is_record(record):
@@ -50,6 +68,33 @@ def is_deposit(record):
     return schema_prefix(record.get('$schema')) == 'deposits'
 
 
+def _user_provides():
+    """Get the user's provides, computed once per request and identity."""
+    identity = g.identity
+    needs = frozenset(identity.provides)
+    provides = getattr(g, 'cds_user_provides', None)
+    # the identity can be replaced (i.e. login) or get its provides changed
+    if provides is None or provides[0] is not identity or \
+            provides[1] != needs:
+        values = [need.value for need in identity.provides]
+        provides = (identity, needs, frozenset(values), values)
+        g.cds_user_provides = provides
+    return provides
+
+
 def get_user_provides():
-    """Extract the user's provides from g."""
-    return [need.value for need in g.identity.provides]
+    """Extract the user's provides from g.
+
+    :returns: A frozen set of the values of the needs of the identity, shared
+        by all the permission checks of the request.
+    """
+    return _user_provides()[2]
+
+
+def get_user_provides_terms():
+    """Extract the user's provides from g, as terms of a search filter.
+
+    :returns: A list of the values of the needs of the identity, shared by all
+        the search filters of the request (it must not be modified).
+    """
+    return _user_provides()[3]
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Document Server.
+# Copyright (C) 2017 CERN.
+#
+# CERN Document Server is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Document Server is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Document Server; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Download of remote files with concurrent HTTP range requests."""
+
+from __future__ import absolute_import
+
+import os
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+def supports_ranges(response):
+    """Check if the server accepts range requests for the given resource."""
+    return response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+
+
+def journal_path(output):
+    """Get the file recording the chunks downloaded into ``output``."""
+    return '{0}.chunks'.format(output)
+
+
+def download_ranges(uri, output, size, chunk_size, connections,
+                    progress_callback=None):
+    """Download a file in chunks, fetched over a pool of connections.
+
+    Each chunk is recorded in a journal next to ``output`` once it has been
+    completely written, so that calling again this function after a failure
+    only downloads the missing chunks.
+
+    :param uri: URL of the file to download.
+    :param output: path where the file is written.
+    :param size: size of the remote file.
+    :param chunk_size: number of bytes requested at a time.
+    :param connections: maximum number of concurrent requests.
+    :param progress_callback: function taking as parameters the total size
+        and the number of bytes downloaded so far.
+    """
+    journal = journal_path(output)
+    done = set()
+    if os.path.exists(output) and os.path.exists(journal):
+        with open(journal) as fp:
+            done = set(line.strip() for line in fp if line.strip())
+    else:
+        with open(output, 'wb') as fp:
+            fp.truncate(size)
+
+    ranges = [(start, min(start + chunk_size, size) - 1)
+              for start in range(0, size, chunk_size)]
+    pending = [r for r in ranges if '{0}-{1}'.format(*r) not in done]
+    downloaded = sum(end - start + 1 for (start, end) in ranges
+                     if (start, end) not in pending)
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=connections)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    pool = ThreadPool(processes=max(min(connections, len(pending)), 1))
+    try:
+        fetch = partial(_download_range, session, uri, output)
+        with open(journal, 'a') as fp:
+            for (start, end) in pool.imap_unordered(fetch, pending):
+                fp.write('{0}-{1}\n'.format(start, end))
+                fp.flush()
+                downloaded += end - start + 1
+                if progress_callback:
+                    progress_callback(size, downloaded)
+    finally:
+        pool.terminate()
+        session.close()
+
+    os.remove(journal)
+
+
+def _download_range(session, uri, output, byte_range):
+    """Download a single chunk and write it at its offset."""
+    start, end = byte_range
+    response = session.get(
+        uri, stream=True,
+        headers={'Range': 'bytes={0}-{1}'.format(start, end)})
+    response.raise_for_status()
+    if response.status_code != 206:
+        raise RuntimeError('Server ignored the range request.')
+
+    written = 0
+    with open(output, 'r+b') as fp:
+        fp.seek(start)
+        for data in response.iter_content(chunk_size=64 * 1024):
+            fp.write(data)
+            written += len(data)
+    if written != end - start + 1:
+        raise IOError('Incomplete chunk {0}-{1} of {2}'.format(
+            start, end, uri))
+    return byte_range
+
+
+def remove_partial_download(output):
+    """Remove a partially downloaded file and its journal."""
+    for path in [output, journal_path(output)]:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Document Server.
+# Copyright (C) 2017 CERN.
+#
+# CERN Document Server is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Document Server is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Document Server; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Webhooks models."""
+
+from __future__ import absolute_import
+
+import sqlalchemy
+
+from invenio_webhooks.models import Event
+
+event_deposit_id = Event.payload.op('->>')(
+    sqlalchemy.literal_column("'deposit_id'"))
+"""Id of the deposit of an event, as text extracted from its payload."""
+
+ix_webhooks_events_deposit_id = sqlalchemy.Index(
+    'ix_webhooks_events_deposit_id', event_deposit_id)
+"""Expression index used to find the events of a deposit.
+
+Only queries filtering on :data:`event_deposit_id` can use it.
+"""
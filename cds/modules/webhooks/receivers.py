@@ -44,9 +44,10 @@ from invenio_files_rest.models import (ObjectVersion, ObjectVersionTag,
                                        as_object_version)
 
 from .status import ComputeGlobalStatus, iterate_result, collect_info, \
-    GetInfoByID, replace_task_id, ResultEncoder
+    GetInfoByID, replace_task_id, ResultEncoder, ResultsSnapshot, \
+    tasks_status_store
 from .tasks import DownloadTask, ExtractFramesTask, ExtractMetadataTask, \
-    TranscodeVideoTask, update_avc_deposit_state
+    TranscodeVideoTask, create_tags, update_avc_deposit_state
 
 
 def _update_event_bucket(event):
@@ -62,7 +63,7 @@ def build_task_payload(event, task_id):
     """Build payload for a task."""
     raw_info = event.receiver._raw_info(event=event)
     search = GetInfoByID(task_id=task_id)
-    iterate_result(raw_info=raw_info, fun=search)
+    ResultsSnapshot(raw_info).iterate_result(fun=search)
     if search.task_name:
         if isinstance(search.result.info, Exception):
             payload = search.result.info.message['payload']
@@ -123,21 +124,23 @@ class CeleryAsyncReceiver(Receiver):
         iterate_result(
             raw_info=self._raw_info(event),
             fun=lambda task_name, result: result.revoke(terminate=True))
+        tasks_status_store.invalidate(event.payload.get('deposit_id'))
 
     @staticmethod
     def delete_task(event, task_id):
         """Revoke a specific task."""
         AsyncResult(task_id).revoke(terminate=True)
+        tasks_status_store.invalidate(event.payload.get('deposit_id'))
 
     def status(self, event):
         """Get the status."""
-        # get raw info from the celery receiver
-        raw_info = self._raw_info(event)
+        # read all the results of the celery receiver at once
+        snapshot = ResultsSnapshot(self._raw_info(event))
         # extract global status
         global_status = ComputeGlobalStatus()
-        iterate_result(raw_info=raw_info, fun=global_status)
+        snapshot.iterate_result(fun=global_status)
         # extract information
-        info = iterate_result(raw_info=raw_info, fun=collect_info)
+        info = snapshot.iterate_result(fun=collect_info)
         # build response
         return (
             CeleryAsyncReceiver.CELERY_STATES_TO_HTTP.get(
@@ -148,8 +151,7 @@ class CeleryAsyncReceiver(Receiver):
     def persist(self, event, result):
         """Persist event and result after execution."""
         with db.session.begin_nested():
-            status = iterate_result(
-                raw_info=self._raw_info(event),
+            status = ResultsSnapshot(self._raw_info(event)).iterate_result(
                 fun=lambda task_name, result: {
                     task_name: {
                         'id': result.id,
@@ -160,6 +162,8 @@ class CeleryAsyncReceiver(Receiver):
 
             db.session.add(event)
         db.session.commit()
+        # the tasks of the deposit changed
+        tasks_status_store.invalidate(event.payload.get('deposit_id'))
         update_avc_deposit_state(
             deposit_id=event.payload.get('deposit_id'),
             event_id=event.id,
@@ -199,10 +203,11 @@ class Downloader(CeleryAsyncReceiver):
         with db.session.begin_nested():
             object_version = ObjectVersion.create(
                 bucket=event.payload['bucket_id'], key=event.payload['key'])
-            ObjectVersionTag.create(object_version, 'uri_origin',
-                                    event.payload['uri'])
-            ObjectVersionTag.create(object_version, '_event_id', event_id)
-            ObjectVersionTag.create(object_version, 'context_type', 'master')
+            create_tags(object_version, {
+                'uri_origin': event.payload['uri'],
+                '_event_id': event_id,
+                'context_type': 'master',
+            })
         return object_version
 
     @staticmethod
@@ -340,6 +345,15 @@ class AVCWorkflow(CeleryAsyncReceiver):
         """Create, if doesn't exists, the version object."""
         event_id = str(event.id)
         with db.session.begin_nested():
+            tags = {
+                # add tag with corresponding event
+                '_event_id': event_id,
+                # add tag for preview
+                'preview': True,
+                # add tags for file type
+                'media_type': 'video',
+                'context_type': 'master',
+            }
             # create a object version if doesn't exists
             if 'version_id' in event.payload:
                 version_id = event.payload['version_id']
@@ -348,16 +362,9 @@ class AVCWorkflow(CeleryAsyncReceiver):
                 object_version = ObjectVersion.create(
                     bucket=event.payload['bucket_id'],
                     key=event.payload['key'])
-                ObjectVersionTag.create(object_version, 'uri_origin',
-                                        event.payload['uri'])
+                tags['uri_origin'] = event.payload['uri']
                 version_id = str(object_version.version_id)
-            # add tag with corresponding event
-            ObjectVersionTag.create(object_version, '_event_id', event_id)
-            # add tag for preview
-            ObjectVersionTag.create(object_version, 'preview', True)
-            # add tags for file type
-            ObjectVersionTag.create(object_version, 'media_type', 'video')
-            ObjectVersionTag.create(object_version, 'context_type', 'master')
+            create_tags(object_version, tags)
             event.response['version_id'] = version_id
         return object_version
 
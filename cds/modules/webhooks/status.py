@@ -28,32 +28,50 @@ from __future__ import absolute_import
 
 import json
 import sqlalchemy
+from collections import namedtuple
 
+from celery import current_app as celery_app
 from celery import states
-
+from celery.backends.base import KeyValueStoreBackend
+from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier
+from invenio_records.models import RecordMetadata
 from invenio_webhooks.models import Event
 
+from ..cache import RedisStore
+from .models import event_deposit_id
+
 
 def get_deposit_events(deposit_id):
     """Get a list of events associated with a deposit."""
-    #  return Event.query.filter(
-    #      Event.payload.op('->>')(
-    #          'deposit_id').cast(String) == self['_deposit']['id']).all()
-    deposit_id = str(deposit_id)
+    return get_events_for_deposits([deposit_id])
+
+
+def get_events_for_deposits(deposit_ids):
+    """Get a list of events associated with any of the deposits.
+
+    The query form matches the ``ix_webhooks_events_deposit_id`` index.
+    """
+    deposit_ids = [str(deposit_id) for deposit_id in deposit_ids]
+    if not deposit_ids:
+        return []
     return Event.query.filter(
-        sqlalchemy.cast(
-            Event.payload['deposit_id'],
-            sqlalchemy.String) == sqlalchemy.type_coerce(
-                deposit_id, sqlalchemy.JSON)
+        event_deposit_id.in_([
+            sqlalchemy.type_coerce(deposit_id, sqlalchemy.String)
+            for deposit_id in deposit_ids
+        ])
     ).all()
 
 
 def iterate_events_results(events, fun):
-    """Iterate over the results of each event."""
-    for event in events:
-        if event.receiver.has_result(event):
-            raw_info = event.receiver._raw_info(event)
-            iterate_result(raw_info=raw_info, fun=fun)
+    """Iterate over the results of each event.
+
+    The results of all the events are read with a single
+    :class:`ResultsSnapshot`.
+    """
+    raw_infos = [event.receiver._raw_info(event) for event in events
+                 if event.receiver.has_result(event)]
+    ResultsSnapshot(raw_infos).iterate_result(fun=fun)
     return fun
 
 
@@ -65,6 +83,110 @@ def get_tasks_status_by_task(events, statuses=None):
     return status_extractor.statuses
 
 
+def get_deposits_tasks(deposit_ids):
+    """Get the tasks of some deposits as ``{task_id: (task_name, status)}``.
+
+    The tasks are read from the :data:`tasks_status_store`. The deposits that
+    are not there yet are populated all together, with one query for their
+    events and one result backend call for their tasks.
+
+    :param deposit_ids: the deposit ids, or the PIDs (i.e. ``{'type': ...,
+        'value': ...}``) of published videos as in ``Project.video_ids``.
+    """
+    deposit_ids = normalize_deposit_ids(deposit_ids)
+    stored = tasks_status_store.get_many(deposit_ids)
+    missing = [deposit_id for deposit_id in deposit_ids
+               if stored[deposit_id] is None]
+    if missing:
+        # collect the results of the events of each deposit
+        raw_infos = {str(deposit_id): [] for deposit_id in missing}
+        for event in get_events_for_deposits(missing):
+            if event.receiver.has_result(event):
+                raw_infos[event.payload['deposit_id']].append(
+                    event.receiver._raw_info(event))
+        snapshot = ResultsSnapshot(list(raw_infos.values()))
+        for deposit_id in missing:
+            collector = CollectInfoTasks()
+            snapshot.iterate_result(
+                fun=collector, raw_info=raw_infos[str(deposit_id)])
+            stored[deposit_id] = tasks_status_store.populate(deposit_id, {
+                result.id: (task_name, result_status(result))
+                for task_name, result in collector
+            })
+    tasks = {}
+    for deposit_id in deposit_ids:
+        tasks.update(stored[deposit_id])
+    return tasks
+
+
+def normalize_deposit_ids(ids):
+    """Get the deposit id of each id, as a string.
+
+    The PIDs of the published videos are resolved to the deposit ids of
+    their records, all together with a single query.
+    """
+    pids = set((id_['type'], str(id_['value'])) for id_ in ids
+               if isinstance(id_, dict))
+    resolved = {}
+    if pids:
+        query = db.session.query(
+            PersistentIdentifier.pid_type, PersistentIdentifier.pid_value,
+            RecordMetadata.json
+        ).join(
+            RecordMetadata,
+            RecordMetadata.id == PersistentIdentifier.object_uuid
+        ).filter(sqlalchemy.or_(*[
+            sqlalchemy.and_(PersistentIdentifier.pid_type == pid_type,
+                            PersistentIdentifier.pid_value == pid_value)
+            for pid_type, pid_value in pids
+        ]))
+        for pid_type, pid_value, data in query:
+            resolved[(pid_type, pid_value)] = str(data['_deposit']['id'])
+
+    deposit_ids = []
+    for id_ in ids:
+        if isinstance(id_, dict):
+            id_ = resolved.get((id_['type'], str(id_['value'])))
+            if id_ is None:
+                continue
+        deposit_ids.append(str(id_))
+    return deposit_ids
+
+
+def get_tasks_meta(task_ids):
+    """Get the meta of several tasks from celery.
+
+    On key/value result backends (e.g. Redis) all the metas are read with a
+    single ``MGET``. Exceptions of failed tasks are left serialized.
+
+    :returns: a dictionary ``{task_id: meta}``.
+    """
+    task_ids = list(set(task_ids))
+    backend = celery_app.backend
+    if not task_ids or not isinstance(backend, KeyValueStoreBackend):
+        return {task_id: backend.get_task_meta(task_id)
+                for task_id in task_ids}
+    keys = [backend.get_key_for_task(task_id) for task_id in task_ids]
+    values = backend.mget(keys)
+    if hasattr(values, 'items'):
+        # e.g. memcached returns only the keys found
+        values = [values.get(key) for key in keys]
+    return {
+        task_id: backend.decode(value) if value else {
+            'status': states.PENDING, 'result': None
+        }
+        for task_id, value in zip(task_ids, values)
+    }
+
+
+def get_deposits_tasks_status(deposit_ids, statuses=None):
+    """Get tasks status of some deposits grouped by task name."""
+    status_extractor = CollectStatusesByTask(statuses=statuses or {})
+    for task_name, status in get_deposits_tasks(deposit_ids).values():
+        status_extractor.add(task_name, status)
+    return status_extractor.statuses
+
+
 def iterate_result(raw_info, fun):
     """Iterate through raw information generated by celery receivers.
 
@@ -85,6 +207,64 @@ def iterate_result(raw_info, fun):
         return fun(task_name, result)
 
 
+class ResultView(namedtuple('ResultView', ['id', 'status', 'result'])):
+    """Immutable view of a celery result, as read by a snapshot."""
+
+    __slots__ = ()
+
+    @property
+    def info(self):
+        """Task return value or exception, as :attr:`AsyncResult.info`."""
+        return self.result
+
+    @classmethod
+    def from_meta(cls, task_id, meta):
+        """Build the view of a task from its meta."""
+        result = meta.get('result')
+        if meta['status'] in states.EXCEPTION_STATES and \
+                isinstance(result, dict) and 'exc_type' in result:
+            result = celery_app.backend.exception_to_python(result)
+        return cls(id=task_id, status=meta['status'], result=result)
+
+
+class ResultsSnapshot(object):
+    """Snapshot of all the celery results of a raw info tree.
+
+    The meta of every task is read once, with a single result backend call
+    (see :func:`get_tasks_meta`), and the visitors get :class:`ResultView`
+    instead of :class:`celery.result.AsyncResult`, whose attributes each hit
+    the result backend.
+    """
+
+    def __init__(self, raw_info):
+        """Read the results of the tasks of a raw info tree."""
+        self._raw_info = raw_info
+        task_ids = []
+        iterate_result(
+            raw_info=raw_info,
+            fun=lambda task_name, result: task_ids.append(result.id))
+        self._views = {
+            task_id: ResultView.from_meta(task_id, meta)
+            for task_id, meta in get_tasks_meta(task_ids).items()
+        }
+
+    def __getitem__(self, task_id):
+        """Get the view of the result of a task."""
+        return self._views[task_id]
+
+    def iterate_result(self, fun, raw_info=None):
+        """Iterate through the results, passing their views to ``fun``.
+
+        See :func:`iterate_result`.
+
+        :param raw_info: a subtree of the snapshot raw info, by default the
+            whole tree.
+        """
+        return iterate_result(
+            raw_info=self._raw_info if raw_info is None else raw_info,
+            fun=lambda task_name, result: fun(task_name, self[result.id]))
+
+
 def _compute_status(statuses):
     """Compute minimum state."""
     for status_to_check in [states.FAILURE, states.STARTED,
@@ -97,6 +277,14 @@ def _compute_status(statuses):
     return states.SUCCESS
 
 
+def result_status(result):
+    """Get the status of a celery result.
+
+    If the result is not anymore on celery cache, it's considered successful.
+    """
+    return result.status if result.result is not None else states.SUCCESS
+
+
 class ComputeGlobalStatus(object):
     """Compute a global status from celery receiver raw info."""
 
@@ -144,11 +332,13 @@ class CollectStatusesByTask(object):
 
     def __call__(self, task_name, result):
         """Update status collection."""
-        old_status = self._statuses.get(task_name, states.SUCCESS)
         # get new status from celery only if still exists on celery cache
-        new_status = result.status \
-            if result.result is not None else states.SUCCESS
-        self._statuses[task_name] = _compute_status([old_status, new_status])
+        self.add(task_name, result_status(result))
+
+    def add(self, task_name, status):
+        """Update status collection with the status of a task."""
+        old_status = self._statuses.get(task_name, states.SUCCESS)
+        self._statuses[task_name] = _compute_status([old_status, status])
 
     @property
     def statuses(self):
@@ -195,6 +385,98 @@ class GetInfoByID(object):
             self.result = result
 
 
+class TasksStatusStore(RedisStore):
+    """Materialized status of the tasks run on each deposit.
+
+    For each deposit, a Redis hash maps the id of its tasks to their name and
+    last known status. The hash is filled from the events the first time the
+    deposit is read, and then kept up-to-date by the tasks themselves on each
+    state change, so that loading a deposit doesn't need to query the events
+    and the celery results anymore.
+
+    Any change to the list of tasks of a deposit (e.g. a new event, a task
+    re-run or revoked) must :meth:`invalidate` it.
+    """
+
+    POPULATED = '_populated'
+    """Field marking a deposit whose tasks have all been stored."""
+
+    redis_url_config = 'CDS_TASKS_STATUS_REDIS_URL'
+    ttl_config = 'CDS_TASKS_STATUS_TTL'
+    default_ttl = 24 * 60 * 60
+    prefix = 'cds_tasks_status'
+
+    def update(self, deposit_id, task_id, task_name, status):
+        """Store the new status of a task."""
+        redis = self._redis()
+        if redis and deposit_id and task_id:
+            key = self._redis_key(deposit_id)
+            pipe = redis.pipeline()
+            pipe.hset(key, task_id, json.dumps([task_name, status]))
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+
+    def populate(self, deposit_id, tasks):
+        """Store all the tasks of a deposit.
+
+        The status already stored by a task is kept, being more recent than
+        the one read from celery.
+
+        :param tasks: a dictionary ``{task_id: (task_name, status)}``.
+        :returns: the tasks of the deposit, as stored.
+        """
+        redis = self._redis()
+        if not redis or not deposit_id:
+            return tasks
+        key = self._redis_key(deposit_id)
+        pipe = redis.pipeline()
+        for task_id, (task_name, status) in tasks.items():
+            pipe.hsetnx(key, task_id, json.dumps([task_name, status]))
+        pipe.hset(key, self.POPULATED, 1)
+        pipe.expire(key, self.ttl)
+        pipe.hgetall(key)
+        return self._load(pipe.execute()[-1])
+
+    def _load(self, values):
+        """Load the tasks of a deposit, or ``None`` if not populated."""
+        values = {field.decode('utf-8'): value.decode('utf-8')
+                  for field, value in values.items()}
+        if values.pop(self.POPULATED, None) is None:
+            return None
+        return {task_id: tuple(json.loads(value))
+                for task_id, value in values.items()}
+
+    def get_many(self, deposit_ids):
+        """Get the tasks of some deposits.
+
+        :returns: a dictionary with, for each deposit, its tasks as
+            ``{task_id: (task_name, status)}`` or ``None`` if the deposit is
+            not in the store.
+        """
+        redis = self._redis()
+        if not redis:
+            return {deposit_id: None for deposit_id in deposit_ids}
+        pipe = redis.pipeline()
+        for deposit_id in deposit_ids:
+            pipe.hgetall(self._redis_key(deposit_id))
+        return {deposit_id: self._load(values)
+                for deposit_id, values in zip(deposit_ids, pipe.execute())}
+
+    def get(self, deposit_id):
+        """Get the tasks of a deposit, or ``None`` if not in the store."""
+        return self.get_many([deposit_id])[deposit_id]
+
+    def invalidate(self, deposit_id):
+        """Remove a deposit, which will be populated again on next read."""
+        redis = self._redis()
+        if redis and deposit_id:
+            redis.delete(self._redis_key(deposit_id))
+
+
+tasks_status_store = TasksStatusStore()
+"""Store of the status of the tasks of each deposit."""
+
+
 def replace_task_id(result, old_task_id, new_task_id):
     """Replace task id in a serialized version of results."""
     try:
@@ -29,6 +29,7 @@ import fnmatch
 import hashlib
 import json
 import jsonpatch
+import mmap
 import os
 import requests
 import shutil
@@ -36,8 +37,6 @@ import signal
 import tempfile
 import time
 
-from PIL import Image
-from flask_iiif.utils import create_gif_from_frames
 from functools import partial
 
 from cds_sorenson.api import get_encoding_status, get_preset_info, \
@@ -46,6 +45,7 @@ from cds_sorenson.error import InvalidResolutionError
 from celery import Task, shared_task, current_app as celery_app
 from celery.states import FAILURE, STARTED, SUCCESS, REVOKED
 from celery.exceptions import Ignore
+from flask import current_app
 
 from invenio_db import db
 from invenio_files_rest.models import (FileInstance, ObjectVersion,
@@ -55,11 +55,18 @@ from invenio_records import Record
 from invenio_sse import current_sse
 from sqlalchemy.orm import aliased
 from sqlalchemy.orm.exc import ConcurrentModificationError
-from invenio_indexer.api import RecordIndexer
 from werkzeug.utils import import_string
 
 from ..deposit.api import deposit_video_resolver
-from ..ffmpeg import ff_frames, ff_probe_all
+from ..deposit.cache import mark_buckets_changed
+from ..deposit.indexer import reindex_queue
+from ..ffmpeg import ff_frames, ff_gif, ff_probe_all
+from .download import download_ranges, remove_partial_download, \
+    supports_ranges
+from .status import tasks_status_store
+
+MONITORING_TAG = '_sorenson_monitoring'
+"""Tag of the transcoded files whose job is monitored asynchronously."""
 
 
 def sse_publish_event(channel, type_, state, meta):
@@ -97,13 +104,54 @@ class AVCTask(Task):
             return self.run(*args, **kwargs)
 
     def update_state(self, task_id=None, state=None, meta=None):
-        """."""
+        """Store the new state and publish it on the SSE channel.
+
+        Progress updates (i.e. ``STARTED`` state) are coalesced following
+        ``CDS_AVC_PROGRESS_UPDATES``, all other states are always sent.
+        """
         self._base_payload.update(meta.get('payload', {}))
         meta['payload'] = self._base_payload
+        if state == STARTED and self._skip_progress_update():
+            return
         super(AVCTask, self).update_state(task_id, state, meta)
+        self._update_tasks_status_store(task_id=task_id, state=state)
         sse_publish_event(channel=self.sse_channel, type_=self._type,
                           state=state, meta=meta)
 
+    def _update_tasks_status_store(self, task_id, state):
+        """Keep the materialized tasks status of the deposit up-to-date."""
+        if state != getattr(self, '_stored_state', None):
+            tasks_status_store.update(
+                deposit_id=self._base_payload.get('deposit_id'),
+                task_id=task_id or self.request.id,
+                task_name=self._type,
+                status=state)
+            self._stored_state = state
+
+    def _skip_progress_update(self):
+        """Check if a progress update is too close to the previous one.
+
+        An update is skipped only if both less than ``interval`` seconds have
+        passed and the percentage moved by less than ``percentage`` since the
+        last update sent.
+        """
+        throttle = current_app.config.get(
+            'CDS_AVC_PROGRESS_UPDATES', {}).get(self._type)
+        now = time.time()
+        percentage = self._base_payload.get('percentage')
+        last = getattr(self, '_last_progress_update', None)
+        if throttle and last:
+            last_time, last_percentage = last
+            too_soon = now - last_time < throttle.get('interval', 0)
+            too_small = (
+                percentage is None or last_percentage is None or
+                abs(percentage - last_percentage) <
+                throttle.get('percentage', 0))
+            if too_soon and too_small:
+                return True
+        self._last_progress_update = (now, percentage)
+        return False
+
     def _meta_exception_envelope(self, exc):
         """Create a envelope for exceptions.
 
@@ -150,6 +198,8 @@ class AVCTask(Task):
 
     def set_base_payload(self, payload=None):
         """Set default base payload."""
+        self._last_progress_update = None
+        self._stored_state = None
         self._base_payload = {
             'deposit_id': self.deposit_id,
             'event_id': self.event_id,
@@ -173,14 +223,43 @@ class DownloadTask(AVCTask):
         self._type = 'file_download'
 
     @staticmethod
-    def clean(version_id, *args, **kwargs):
+    def _partial_download(version_id):
+        """Get the local file where a ranged download is written.
+
+        It depends only on the object version, so that a retry resumes it.
+        Once complete, it is copied in the object version through the
+        storage of the bucket.
+        """
+        folder = current_app.config.get('CDS_DOWNLOAD_PARTIAL_FOLDER') or \
+            tempfile.gettempdir()
+        return os.path.join(folder, 'cds-download-{0}'.format(version_id))
+
+    @classmethod
+    def clean(cls, version_id, *args, **kwargs):
         """Undo download task."""
+        # Delete any partial download
+        remove_partial_download(cls._partial_download(version_id))
         # Delete the file and the object version
         dispose_object_version(version_id)
 
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        """Remove any partial download, once the task gave up retrying."""
+        obj_id = getattr(self, 'obj_id', None)
+        if obj_id:
+            with celery_app.flask_app.app_context():
+                remove_partial_download(self._partial_download(obj_id))
+        super(DownloadTask, self).on_failure(
+            exc, task_id, args, kwargs, einfo)
+
     def run(self, uri, **kwargs):
         """Download file from a URL.
 
+        If the server accepts range requests, the file is fetched in chunks of
+        ``CDS_DOWNLOAD_CHUNK_SIZE`` bytes over ``CDS_DOWNLOAD_CONNECTIONS``
+        concurrent connections, and the task is retried on errors resuming
+        the download from the last complete chunk. Otherwise it is streamed
+        over a single connection.
+
         :param self: reference to instance of task base class
         :param uri: URL of the file to download.
         """
@@ -209,9 +288,29 @@ class DownloadTask(AVCTask):
 
             self.update_state(state=STARTED, meta=meta)
 
-        self.object.set_contents(response.raw,
-                                 progress_callback=progress_updater,
-                                 size=headers_size)
+        config = current_app.config
+        connections = config.get('CDS_DOWNLOAD_CONNECTIONS', 1)
+        chunk_size = config.get('CDS_DOWNLOAD_CHUNK_SIZE', 16 * 1024 * 1024)
+        if connections > 1 and headers_size and headers_size > chunk_size \
+                and supports_ranges(response):
+            response.close()
+            output = self._partial_download(self.obj_id)
+            try:
+                download_ranges(
+                    uri, output, headers_size, chunk_size, connections,
+                    progress_callback=progress_updater)
+            except (IOError, RuntimeError, requests.RequestException) as exc:
+                raise self.retry(
+                    exc=exc,
+                    max_retries=config.get('CDS_DOWNLOAD_MAX_RETRIES', 3),
+                    countdown=config.get('CDS_DOWNLOAD_RETRY_COUNTDOWN', 10))
+            with open(output, 'rb') as stream:
+                self.object.set_contents(stream, size=headers_size)
+            remove_partial_download(output)
+        else:
+            self.object.set_contents(response.raw,
+                                     progress_callback=progress_updater,
+                                     size=headers_size)
 
         db.session.commit()
 
@@ -270,18 +369,20 @@ class ExtractMetadataTask(AVCTask):
         """
         recid = str(PersistentIdentifier.get(
             'depid', self.deposit_id).object_uuid)
-        uri = uri or self.object.file.uri
+        checksum = None
+        if not uri:
+            uri = self.object.file.uri
+            checksum = self.object.file.checksum
 
         self._base_payload.update(uri=uri)
 
         # Extract video's metadata using `ff_probe`
-        metadata = json.loads(ff_probe_all(uri))
+        metadata = json.loads(ff_probe_all(uri, checksum=checksum))
         extracted_dict = dict(metadata['format'], **metadata['streams'][0])
 
         # Add technical information to the ObjectVersion as Tags
-        [ObjectVersionTag.create(self.object, k, v)
-         for k, v in extracted_dict.items()
-         if k in self._all_keys]
+        create_tags(self.object, dict(
+            (k, v) for k, v in extracted_dict.items() if k in self._all_keys))
 
         tags = self.object.get_tags()
 
@@ -375,15 +476,17 @@ class ExtractFramesTask(AVCTask):
             self.update_state(state=STARTED, meta=meta)
 
         def create_object(key, media_type, context_type, **tags):
-            """Create object versions with given type and tags."""
+            """Create object versions with given type and tags.
+
+            Tags are only collected, to be all created at once.
+            """
             obj = ObjectVersion.create(
                 bucket=self.object.bucket,
                 key=key,
                 stream=open(in_output(key), 'rb'))
-            ObjectVersionTag.create(obj, 'master', self.obj_id)
-            ObjectVersionTag.create(obj, 'media_type', media_type)
-            ObjectVersionTag.create(obj, 'context_type', context_type)
-            [ObjectVersionTag.create(obj, k, tags[k]) for k in tags]
+            tags.update(master=self.obj_id, media_type=media_type,
+                        context_type=context_type)
+            return obj, tags
 
         # Generate frames
         ff_frames(input_file=self.object.file.uri,
@@ -395,24 +498,19 @@ class ExtractFramesTask(AVCTask):
             os.listdir(output_folder),
             key=lambda f: int(f.rsplit('-', 1)[1].split('.', 1)[0]))
 
-        [create_object(filename, 'image', 'frame',
-                       timestamp=start_time + (i + 1) * time_step)
-         for i, filename in enumerate(frames)]
+        objects_tags = [create_object(
+            filename, 'image', 'frame',
+            timestamp=start_time + (i + 1) * time_step)
+            for i, filename in enumerate(frames)]
 
         # Generate GIF images
         gif_filename = 'frames.gif'
-
-        images = []
-        for f in frames:
-            image = Image.open(in_output(f))
-            # Convert image for better quality
-            im = image.convert('RGB').convert(
-                'P', palette=Image.ADAPTIVE, colors=255
-            )
-            images.append(im)
-        gif_image = create_gif_from_frames(images)
-        gif_image.save(in_output(gif_filename), save_all=True)
-        create_object(gif_filename, 'image', 'frames-preview')
+        ff_gif(input_pattern=in_output('frame-%d.jpg'),
+               output=in_output(gif_filename),
+               width=current_app.config.get('CDS_FRAMES_PREVIEW_WIDTH', 480))
+        objects_tags.append(
+            create_object(gif_filename, 'image', 'frames-preview'))
+        bulk_create_tags(objects_tags)
 
         # Cleanup
         shutil.rmtree(output_folder)
@@ -456,6 +554,11 @@ class TranscodeVideoTask(AVCTask):
             preset_quality=preset_quality, master_key=object_version.key)
         object_version = ObjectVersion.query.filter_by(
             bucket_id=object_version.bucket_id, key=obj_key).first()
+        if object_version:
+            # Stop the job if it is still monitored asynchronously
+            monitoring = object_version.get_tags().get(MONITORING_TAG)
+            if monitoring:
+                stop_encoding(json.loads(monitoring)['job_info']['job_id'])
         dispose_object_version(object_version)
 
     def run(self, preset_quality, sleep_time=5, *args, **kwargs):
@@ -508,14 +611,17 @@ class TranscodeVideoTask(AVCTask):
             self.set_revoke_handler(partial(stop_encoding, job_id))
 
             # Create ObjectVersionTags
-            ObjectVersionTag.create(obj, 'master', self.obj_id)
-            ObjectVersionTag.create(obj, '_sorenson_job_id', job_id)
-            ObjectVersionTag.create(obj, 'preset_quality', preset_quality)
-            ObjectVersionTag.create(obj, 'media_type', 'video')
-            ObjectVersionTag.create(obj, 'context_type', 'subformat')
             preset_info = get_preset_info(aspect_ratio, preset_quality)
-            [ObjectVersionTag.create(obj, key, preset_info[key])
-             for key in ['video_bitrate', 'width', 'height']]
+            tags = dict((key, preset_info[key])
+                        for key in ['video_bitrate', 'width', 'height'])
+            tags.update({
+                'master': self.obj_id,
+                '_sorenson_job_id': job_id,
+                'preset_quality': preset_quality,
+                'media_type': 'video',
+                'context_type': 'subformat',
+            })
+            create_tags(obj, tags)
 
             # Information necessary for monitoring
             job_info = dict(
@@ -538,6 +644,12 @@ class TranscodeVideoTask(AVCTask):
                 message='Started transcoding.')
         )
 
+        if current_app.config.get('CDS_SORENSON_ASYNC_MONITORING', False):
+            # Release the worker: the job is followed by `monitor_transcoding`
+            # which is in charge of updating the state of this task.
+            self._start_monitoring(obj, job_info)
+            raise Ignore()
+
         status = ''
         # Monitor job and report accordingly
         while status != 'Finished':
@@ -556,19 +668,119 @@ class TranscodeVideoTask(AVCTask):
 
             time.sleep(sleep_time)
 
-        # Set file's location, if job has completed
-        self._clean_file_name(output_file)
+        self._finalize(job_info)
+
+    @classmethod
+    def _finalize(cls, job_info):
+        """Set file's location, once the job has completed."""
+        uri = job_info['uri']
+        cls._clean_file_name(uri)
         with db.session.begin_nested():
-            uri = output_file
-            with open(uri, 'rb') as transcoded_file:
-                digest = hashlib.md5(transcoded_file.read()).hexdigest()
+            digest = file_checksums(uri, algorithms=('md5', ))['md5']
             size = os.path.getsize(uri)
             checksum = '{0}:{1}'.format('md5', digest)
+            file_instance = FileInstance.get(job_info['file_instance'])
             file_instance.set_uri(uri, size, checksum)
             as_object_version(
                 job_info['version_id']).set_file(file_instance)
         db.session.commit()
 
+    def _start_monitoring(self, obj, job_info):
+        """Store what is needed to follow the job outside of this task."""
+        monitoring = dict(
+            task_id=self.request.id,
+            version_id=self.obj_id,
+            deposit_id=self.deposit_id,
+            event_id=self.event_id,
+            sse_channel=self.sse_channel,
+            job_info=job_info,
+        )
+        with db.session.begin_nested():
+            ObjectVersionTag.create(obj, MONITORING_TAG,
+                                    json.dumps(monitoring))
+        db.session.commit()
+
+    @staticmethod
+    def _claim_monitoring(version_id):
+        """Stop monitoring a job, unless it was already stopped.
+
+        The monitoring tag is deleted in its own transaction, so only one of
+        the concurrent runs of :func:`monitor_transcoding` claims the job.
+
+        :returns: ``True`` if the job was claimed.
+        """
+        with db.session.begin_nested():
+            deleted = ObjectVersionTag.query.filter_by(
+                version_id=version_id, key=MONITORING_TAG
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted > 0
+
+    @classmethod
+    def monitor(cls, monitoring):
+        """Check an asynchronously monitored job and report its progress.
+
+        :param monitoring: the information stored by the task which started
+            the job, see :meth:`TranscodeVideoTask._start_monitoring`.
+        """
+        task = cls()
+        task.deposit_id = monitoring['deposit_id']
+        task.event_id = monitoring['event_id']
+        task.sse_channel = monitoring['sse_channel']
+        task.object = as_object_version(monitoring['version_id'])
+        task.obj_id = monitoring['version_id']
+        task.set_base_payload()
+
+        task_id = monitoring['task_id']
+        job_info = monitoring['job_info']
+        task._base_payload.update(preset_quality=job_info['preset_quality'])
+
+        status, percentage = get_encoding_status(job_info['job_id'])
+        if status in ('Error', 'Finished') and \
+                not cls._claim_monitoring(job_info['version_id']):
+            # Already completed by another run
+            return
+        if status == 'Error':
+            task.on_failure(RuntimeError('Error transcoding'), task_id,
+                            None, None, None)
+        elif status == 'Finished':
+            try:
+                cls._finalize(job_info)
+            except Exception:
+                db.session.rollback()
+                # Give the job back to the next run
+                with db.session.begin_nested():
+                    ObjectVersionTag.create(
+                        as_object_version(job_info['version_id']),
+                        MONITORING_TAG, json.dumps(monitoring))
+                db.session.commit()
+                raise
+            task.on_success(None, task_id)
+        else:
+            job_info['percentage'] = percentage
+            task.update_state(
+                task_id=task_id,
+                state=STARTED,
+                meta=dict(
+                    payload=dict(**job_info),
+                    message='Transcoding {0}'.format(percentage)))
+
+
+@shared_task(ignore_result=True)
+def monitor_transcoding():
+    """Poll Sorenson for all the jobs monitored asynchronously."""
+    if not current_app.config.get('CDS_SORENSON_ASYNC_MONITORING', False):
+        return
+    tags = ObjectVersionTag.query.filter_by(key=MONITORING_TAG).all()
+    for monitoring in [json.loads(tag.value) for tag in tags]:
+        try:
+            TranscodeVideoTask.monitor(monitoring)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception(
+                'Failed monitoring transcoding job {0}'.format(
+                    monitoring['job_info']['job_id']))
+
 
 def patch_record(recid, patch, validator=None):
     """Patch a record."""
@@ -634,8 +846,8 @@ def spread_deposit_update(deposit=None, event_id=None, sse_channel=None):
                     'deposit_id': deposit['_deposit']['id'],
                 }
             })
-        # send deposit to the reindex queue
-        RecordIndexer().bulk_index(iter([str(deposit.id)]))
+        # send deposit to the reindex queue, once per time window
+        reindex_queue.schedule([deposit.id])
 
 
 def update_avc_deposit_state(deposit_id=None, event_id=None, sse_channel=None,
@@ -651,6 +863,70 @@ def update_avc_deposit_state(deposit_id=None, event_id=None, sse_channel=None,
                               sse_channel=sse_channel)
 
 
+def file_checksums(uri, algorithms=('md5', ), chunk_size=1024 * 1024,
+                   use_mmap=False):
+    """Compute several checksums of a file reading it only once.
+
+    The file is hashed chunk by chunk, so memory usage is bounded by
+    ``chunk_size`` whatever the size of the file.
+
+    :param uri: path of the file.
+    :param algorithms: names of the ``hashlib`` algorithms to compute.
+    :param chunk_size: number of bytes hashed at a time.
+    :param use_mmap: memory-map the file instead of reading it.
+    :returns: a dictionary with the hexdigest of each algorithm.
+    """
+    hashes = dict((name, hashlib.new(name)) for name in algorithms)
+    with open(uri, 'rb') as fp:
+        if use_mmap and os.fstat(fp.fileno()).st_size > 0:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in range(0, len(data), chunk_size):
+                    chunk = data[offset:offset + chunk_size]
+                    for hash_ in hashes.values():
+                        hash_.update(chunk)
+            finally:
+                data.close()
+        else:
+            for chunk in iter(partial(fp.read, chunk_size), b''):
+                for hash_ in hashes.values():
+                    hash_.update(chunk)
+    return dict((name, hash_.hexdigest()) for name, hash_ in hashes.items())
+
+
+def create_tags(object_version, tags):
+    """Create all the given tags of an object version at once.
+
+    :param object_version: the object version to tag.
+    :param tags: dictionary of tags.
+    """
+    bulk_create_tags([(object_version, tags)])
+
+
+def bulk_create_tags(objects_tags):
+    """Create the tags of several object versions with a single INSERT.
+
+    :param objects_tags: list of ``(object_version, tags)`` pairs, where
+        ``tags`` is a dictionary.
+    """
+    objects = [as_object_version(obj) for (obj, _) in objects_tags]
+    values = [
+        dict(version_id=obj.version_id, key=key, value=value)
+        for obj, (_, tags) in zip(objects, objects_tags)
+        for key, value in tags.items()
+    ]
+    if values:
+        with db.session.begin_nested():
+            db.session.execute(
+                ObjectVersionTag.__table__.insert().values(values))
+            mark_buckets_changed(
+                db.session(), set(obj.bucket_id for obj in objects))
+        # Tags loaded before the insert are stale
+        for obj in objects:
+            if obj in db.session:
+                db.session.expire(obj, ['tags'])
+
+
 def dispose_object_version(object_version):
     """Clean up resources related to an ObjectVersion."""
     # TODO move the "file removal" in a separate function to be able to
@@ -33,7 +33,7 @@ from invenio_oauth2server import require_api_auth, require_oauth_scopes
 from invenio_webhooks.views import ReceiverEventResource
 
 from .receivers import build_task_payload
-from .status import iterate_result, collect_info, ResultEncoder
+from .status import collect_info, ResultEncoder, ResultsSnapshot
 
 
 class TaskResource(MethodView):
@@ -89,8 +89,7 @@ class EventFeedbackResource(MethodView):
             else:
                 return collect_info(task_name, result)
 
-        result = iterate_result(
-            raw_info=raw_info, fun=collect)
+        result = ResultsSnapshot(raw_info).iterate_result(fun=collect)
         return ResultEncoder().encode(result), 200
 
 
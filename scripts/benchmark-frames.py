@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# This file is part of CERN Document Server.
+# Copyright (C) 2017 CERN.
+#
+# CERN Document Server is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CERN Document Server is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CERN Document Server; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Compare the frame extraction with one or several ffmpeg processes.
+
+The frames are extracted as in the video tasks, from 5% to 95% of the video
+every 10%. Without input video, synthetic ones are generated::
+
+    $ python scripts/benchmark-frames.py --duration 60 --duration 600
+    $ python scripts/benchmark-frames.py /path/to/master.mp4
+"""
+
+from __future__ import absolute_import, print_function
+
+import argparse
+import shutil
+import tempfile
+import time
+from os.path import join
+from subprocess import check_call
+
+from flask import Flask
+
+from cds.modules.ffmpeg import ff_frames, ff_probe
+
+
+def make_video(folder, duration, size, keyframes):
+    """Generate a synthetic H.264 video."""
+    output = join(folder, 'video-{0}s.mp4'.format(duration))
+    check_call([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi',
+        '-i', 'testsrc=duration={0}:size={1}:rate=25'.format(duration, size),
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-g', str(keyframes * 25),
+        output])
+    return output
+
+
+def extract(video, single_pass):
+    """Extract the frames of a video, returning the elapsed seconds."""
+    duration = float(ff_probe(video, 'duration'))
+    folder = tempfile.mkdtemp()
+    try:
+        started = time.time()
+        ff_frames(video, start=duration * 0.05, end=duration * 0.95 + 0.01,
+                  step=duration * 0.1, duration=duration,
+                  output=join(folder, 'frame-{0:d}.jpg'),
+                  single_pass=single_pass)
+        return time.time() - started
+    finally:
+        shutil.rmtree(folder)
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('videos', nargs='*', help='videos to extract from')
+    parser.add_argument('--duration', type=int, action='append',
+                        help='seconds of a synthetic video (repeatable)')
+    parser.add_argument('--size', default='1280x720',
+                        help='size of the synthetic videos')
+    parser.add_argument('--keyframes', type=int, default=10,
+                        help='seconds between keyframes of synthetic videos')
+    parser.add_argument('--parallel', type=int, default=4,
+                        help='CDS_FFMPEG_MAX_PARALLEL')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='runs of each extraction (best one is kept)')
+    args = parser.parse_args()
+
+    app = Flask('benchmark-frames')
+    app.config.update(CDS_FFMPEG_MAX_PARALLEL=args.parallel,
+                      CDS_FFMPEG_FRAME_TIMEOUT=None,
+                      CDS_FFMPEG_PROBE_CACHE_REDIS_URL=None)
+
+    folder = tempfile.mkdtemp()
+    try:
+        videos = args.videos + [
+            make_video(folder, duration, args.size, args.keyframes)
+            for duration in args.duration or
+            ([] if args.videos else [60, 600])]
+        with app.app_context():
+            print('{0:<40} {1:>12} {2:>12}'.format(
+                'video', 'one process', 'per frame'))
+            for video in videos:
+                single, parallel = [
+                    min(extract(video, single_pass)
+                        for _ in range(args.runs))
+                    for single_pass in (True, False)]
+                print('{0:<40} {1:>11.2f}s {2:>11.2f}s'.format(
+                    video[-40:], single, parallel))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
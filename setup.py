@@ -209,6 +209,9 @@ setup(
             'cds_webhooks = cds.modules.webhooks.views:blueprint',
             'cds_redirector = cds.modules.redirector.views:blueprint',
         ],
+        'invenio_db.models': [
+            'cds_webhooks = cds.modules.webhooks.models',
+        ],
         'invenio_pidstore.fetchers': [
             'cds_recid = cds.modules.records.fetchers:recid_fetcher',
             'cds_catid = cds.modules.deposit.fetchers:catid_fetcher',
@@ -31,6 +31,7 @@ import json
 import os
 import shutil
 import tempfile
+import threading
 import requests
 import mock
 import pytest
@@ -68,6 +69,7 @@ from invenio_webhooks import current_webhooks
 from invenio_webhooks.models import CeleryReceiver
 from invenio_deposit.permissions import action_admin_access
 from six import BytesIO
+from six.moves.BaseHTTPServer import HTTPServer
 from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy_utils.functions import create_database, database_exists
 from invenio_files_rest.models import ObjectVersion
@@ -78,8 +80,9 @@ from werkzeug.routing import Rule
 from cds.modules.records.resolver import record_resolver
 from cds.modules.deposit.api import Video
 
-from helpers import (create_category, create_record, sse_simple_add,
-                     sse_failing_task, sse_success_task, new_project,
+from helpers import (FakeSorenson, RangeRequestHandler, create_category,
+                     create_record, sse_simple_add, sse_failing_task,
+                     sse_success_task, new_project,
                      prepare_videos_for_publish, rand_md5, rand_version_id,
                      create_keyword, endpoint_get_schema)
 
@@ -108,6 +111,8 @@ def app():
         CELERY_TRACK_STARTED=True,
         BROKER_TRANSPORT='redis',
         JSONSCHEMAS_HOST='cdslabs.cern.ch',
+        CDS_REFS_CACHE_REDIS_URL=None,
+        CDS_ADMIN_ACCESS_CACHE_REDIS_URL=None,
         DEPOSIT_UI_ENDPOINT='{scheme}://{host}/deposit/{pid_value}',
         PIDSTORE_DATACITE_DOI_PREFIX='10.0000',
     )
@@ -142,6 +147,8 @@ def celery_not_fail_on_eager_app(app):
         CELERY_TRACK_STARTED=True,
         BROKER_TRANSPORT='redis',
         JSONSCHEMAS_HOST='cdslabs.cern.ch',
+        CDS_REFS_CACHE_REDIS_URL=None,
+        CDS_ADMIN_ACCESS_CACHE_REDIS_URL=None,
         PREVIEWER_PREFERENCE=['cds_video', ],
         RECORDS_UI_ENDPOINTS=dict(
             video_preview=dict(
@@ -749,6 +756,39 @@ def mock_sorenson():
     ).start().return_value = None
 
 
+@pytest.yield_fixture()
+def fake_sorenson():
+    """Replace the Sorenson server with a local fake one."""
+    sorenson = FakeSorenson()
+    patchers = [
+        mock.patch('cds.modules.webhooks.tasks.{0}'.format(name),
+                   side_effect=getattr(sorenson, name))
+        for name in ['start_encoding', 'get_encoding_status',
+                     'stop_encoding']
+    ]
+    for patcher in patchers:
+        patcher.start()
+    yield sorenson
+    for patcher in patchers:
+        patcher.stop()
+
+
+@pytest.yield_fixture()
+def http_server():
+    """Local HTTP server standing in for a remote file."""
+    server = HTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    server.content = os.urandom(100 * 1024)
+    server.accept_ranges = True
+    server.requests = []
+    server.url = 'http://127.0.0.1:{0}/video.mp4'.format(server.server_port)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture
 def access_token(api_app, db, users):
     """Fixture that create an access token."""
@@ -29,11 +29,13 @@ from __future__ import absolute_import, print_function
 import copy
 import json
 import random
+import shutil
 import uuid
 from time import sleep
 
 import pkg_resources
 from six import BytesIO
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler
 
 import mock
 from cds.modules.deposit.api import Project, Video
@@ -42,7 +44,7 @@ from cds.modules.records.api import Category, Keyword
 from cds.modules.webhooks.receivers import CeleryAsyncReceiver
 from cds.modules.webhooks.tasks import (AVCTask, TranscodeVideoTask,
                                         update_record)
-from cds_sorenson.api import get_available_preset_qualities
+from cds_sorenson.api import get_available_preset_qualities, get_preset_id
 from celery import chain, group, shared_task, states
 from flask_security import login_user
 from invenio_accounts.models import User
@@ -184,6 +186,67 @@ def transcode_task(bucket, filesize, filename, preset_qualities):
     ])
 
 
+class FakeSorenson(object):
+    """Local stand-in for the Sorenson server.
+
+    Every job "transcodes" by copying the input file and goes through the
+    given list of statuses, one for each status request.
+    """
+
+    def __init__(self, statuses=None):
+        """Init."""
+        self.statuses = statuses or [
+            ('Waiting', 0), ('Transcoding', 45), ('Transcoding', 95),
+            ('Finished', 100)]
+        self.jobs = {}
+        self.stopped = []
+
+    def start_encoding(self, input_file, output_file, preset_name,
+                       aspect_ratio):
+        """Start a job."""
+        get_preset_id(preset_name, aspect_ratio)
+        shutil.copyfile(input_file, output_file)
+        job_id = str(uuid.uuid4())
+        self.jobs[job_id] = iter(self.statuses)
+        return job_id
+
+    def get_encoding_status(self, job_id):
+        """Get the next status of a job (the last one is repeated)."""
+        status = next(self.jobs[job_id], None)
+        if status is None:
+            return self.statuses[-1]
+        return status
+
+    def stop_encoding(self, job_id):
+        """Stop a job."""
+        self.stopped.append(job_id)
+        self.jobs.pop(job_id, None)
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serve ``server.content``, honouring range requests if enabled."""
+
+    def log_message(self, *args):
+        """Do not log requests."""
+
+    def do_GET(self):
+        """Send the content or the requested range."""
+        content = self.server.content
+        byte_range = self.headers.get('Range')
+        self.server.requests.append(byte_range)
+        if byte_range and self.server.accept_ranges:
+            start, end = map(int, byte_range.split('=')[1].split('-'))
+            content = content[start:end + 1]
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content)))
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        self.wfile.write(content)
+
+
 def get_object_count(download=True, frames=True, transcode=True):
     """Get number of ObjectVersions, based on executed tasks."""
     return sum([
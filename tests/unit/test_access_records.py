@@ -26,14 +26,24 @@
 
 from __future__ import absolute_import, print_function
 
+import mock
 import pytest
 import uuid
 
 from flask_principal import RoleNeed, identity_loaded
 from flask_security import login_user
+from invenio_access import DynamicPermission
+from invenio_access.models import ActionUsers
 from invenio_accounts.models import User
+from invenio_files_rest.models import Bucket
+from invenio_deposit.permissions import action_admin_access
 from invenio_records.api import Record
-from cds.modules.records.permissions import (has_admin_permission,
+from cds.modules.deposit.api import Video
+from cds.modules.records.cache import (admin_access_cache,
+                                       bucket_access_cache)
+from cds.modules.records.permissions import (files_permission_factory,
+                                             get_bucket_access,
+                                             has_admin_permission,
                                              record_permission_factory)
 
 
@@ -92,3 +102,69 @@ def test_record_access(db, users, access, action, is_allowed):
     login_and_test(1)
     # Now test that super-user can do all actions
     login_and_test(3)
+
+
+def test_admin_access_cache(api_app, db, users):
+    """Test the admin access is cached until the actions change."""
+    def check(expected):
+        with api_app.test_request_context():
+            login_user(User.query.get(users[0]))
+            assert has_admin_permission() is expected
+            assert has_admin_permission() is expected
+
+    # share the accesses between requests, starting from a clean state
+    redis_url = api_app.config['CACHE_REDIS_URL']
+    with mock.patch.dict(api_app.config,
+                         CDS_ADMIN_ACCESS_CACHE_REDIS_URL=redis_url), \
+            mock.patch('cds.modules.records.cache.DynamicPermission',
+                       side_effect=DynamicPermission) as mock_admin:
+        admin_access_cache.invalidate()
+        # checked once per request, and shared between requests
+        check(False)
+        check(False)
+        assert mock_admin.call_count == 1
+
+        # give the admin access to the user
+        with api_app.test_request_context():
+            login_user(User.query.get(users[0]))
+            db.session.add(ActionUsers.allow(action_admin_access,
+                                             user_id=users[0]))
+            db.session.flush()
+            # not committed yet, checked from the database
+            assert has_admin_permission()
+            assert mock_admin.call_count == 2
+            db.session.commit()
+
+        # invalidated on commit
+        check(True)
+        check(True)
+        assert mock_admin.call_count == 3
+
+
+def test_files_permission_cache(api_app, db, users, api_project):
+    """Test the access of the buckets is cached until changed."""
+    project, video_1, video_2 = api_project
+    bucket = Bucket.get(video_1['_buckets']['deposit'])
+    bucket_access_cache.invalidate([str(bucket.id)])
+
+    with mock.patch('cds.modules.records.permissions.get_bucket_access',
+                    side_effect=get_bucket_access) as mock_access, \
+            api_app.test_request_context():
+        login_user(User.query.get(users[1]))
+        assert not files_permission_factory(bucket, 'object-read').can()
+        assert not files_permission_factory(bucket, 'object-read').can()
+        assert mock_access.call_count == 1
+
+        # give access to the user
+        video = Video.get_record(video_1.id)
+        video['_access'] = {'update': [users[1]]}
+        video.commit()
+        # not committed yet, read from the database
+        assert files_permission_factory(bucket, 'object-read').can()
+        assert mock_access.call_count == 2
+        db.session.commit()
+
+        # invalidated on commit
+        assert files_permission_factory(bucket, 'object-read').can()
+        assert files_permission_factory(bucket, 'object-read').can()
+        assert mock_access.call_count == 3
@@ -36,6 +36,8 @@ from invenio_accounts.testutils import login_user_via_session
 from invenio_indexer.api import RecordIndexer
 
 from cds.modules.records.search import RecordVideosSearch
+from cds.modules.records.utils import get_user_provides, \
+    get_user_provides_terms
 
 
 def mock_provides(needs):
@@ -59,6 +61,31 @@ def test_es_filter(es, users):
     ]
 
 
+def test_user_provides(app):
+    """Test that the user's provides are computed once per identity."""
+    mock_provides([UserNeed('test@test.ch'), RoleNeed('groupX')])
+    provides = get_user_provides()
+    assert provides == frozenset(['test@test.ch', 'groupX'])
+    assert get_user_provides() is provides
+    assert get_user_provides_terms() == ['test@test.ch', 'groupX']
+    assert get_user_provides_terms() is get_user_provides_terms()
+
+    # provides loaded after the first check
+    g.identity.provides.append(RoleNeed('groupY'))
+    assert get_user_provides() == frozenset(
+        ['test@test.ch', 'groupX', 'groupY'])
+
+    # a need swapped for another one, without changing the count
+    g.identity.provides[-1] = RoleNeed('groupW')
+    assert get_user_provides() == frozenset(
+        ['test@test.ch', 'groupX', 'groupW'])
+    assert get_user_provides_terms() == ['test@test.ch', 'groupX', 'groupW']
+
+    # another identity
+    mock_provides([RoleNeed('groupZ')])
+    assert get_user_provides() == frozenset(['groupZ'])
+
+
 def test_deposit_search(api_app, es, users, api_project, json_headers):
     """Test deposit filters and access rights."""
     RecordIndexer().bulk_index([r.id for r in api_project])
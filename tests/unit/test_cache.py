@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of CDS.
+# Copyright (C) 2017 CERN.
+#
+# CDS is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# CDS is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with CDS; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Test the base classes of the Redis caches."""
+
+from __future__ import absolute_import, print_function
+
+from cds.modules.cache import RedisStore, RevisionedCache, get_redis
+
+
+class Cache(RevisionedCache):
+    """Cache for the tests."""
+
+    redis_url_config = 'CACHE_REDIS_URL'
+    prefix = 'cds_test_cache'
+
+
+def test_redis_store(app):
+    """Test the Redis clients are shared and the stores can be disabled."""
+    assert Cache()._redis() is get_redis(app.config['CACHE_REDIS_URL'])
+    assert Cache()._redis() is Cache()._redis()
+    assert RedisStore()._redis() is None
+    assert Cache().ttl == 60 * 60
+    assert Cache()._redis_key('a') == 'cds_test_cache::a'
+
+
+def test_revisioned_cache(app):
+    """Test the entries are served only at their current revision."""
+    cache = Cache()
+    redis = cache._redis()
+    cache.invalidate(['a', 'b'])
+
+    revisions, cached = cache.load_many(redis, ['a', 'b'])
+    assert cached == {}
+    cache.store_many(redis, {'a': [1], 'b': {'c': 2}}, revisions)
+    assert cache.load_many(redis, ['a', 'b']) == (
+        revisions, {'a': [1], 'b': {'c': 2}})
+    assert cache.load_many(redis, []) == ({}, {})
+
+    # an entry stored at an old revision is not served
+    cache.invalidate(['a'])
+    cache.store_many(redis, {'a': [0]}, revisions)
+    new_revisions, cached = cache.load_many(redis, ['a', 'b'])
+    assert new_revisions['a'] == revisions['a'] + 1
+    assert cached == {'b': {'c': 2}}
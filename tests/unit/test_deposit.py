@@ -29,15 +29,22 @@ from __future__ import absolute_import, print_function
 import json
 import mock
 
-from cds.modules.deposit.api import CDSDeposit, Project
+from cds.modules.deposit.api import CDSDeposit, CDSFilesIterator, Project, \
+    Video
+from cds.modules.deposit.cache import files_dump_cache
 from cds.modules.deposit.views import to_links_js
 from flask import current_app, request, url_for
 from invenio_accounts.models import User
 from invenio_accounts.testutils import login_user_via_session
 from invenio_files_rest.models import FileInstance, ObjectVersionTag, Bucket
 from invenio_files_rest.models import ObjectVersion
+from invenio_records.api import Record
+from cds.modules.deposit.indexer import cdsdeposit_indexer_receiver, \
+    prefetch_deposits, reindex_queue
 from cds.modules.deposit.tasks import preserve_celery_states_on_db
 
+from helpers import get_indexed_records_from_mock
+
 
 def test_deposit_link_factory_has_bucket(
         api_app, db, es, users, location, cds_jsonresolver,
@@ -167,3 +174,158 @@ def test_preserve_celery_states_on_db(mock_is_state_changed, api_app,
         indexed.append(arg)
     assert len(indexed) == 1
     assert indexed[0]['_deposit']['id'] == vid1
+
+
+def test_lazy_tasks_status_and_files(api_app, api_project):
+    """Test tasks status and files dump are computed on demand."""
+    project, video_1, video_2 = api_project
+
+    with mock.patch.object(Video, '_get_files_dump',
+                           return_value=[]) as mock_files, \
+            mock.patch.object(Video, '_current_tasks_status',
+                              return_value={}) as mock_status:
+        video = Video.get_record(video_1.id)
+        assert video['title'] == video_1['title']
+        assert mock_files.call_count == 0
+        assert mock_status.call_count == 0
+
+        # the other fields of _deposit don't need the tasks status
+        assert video['_deposit']['id'] == video_1['_deposit']['id']
+        assert video['_deposit'].get('pid') is None
+        assert video['_deposit'].get('created_by') == \
+            video_1['_deposit'].get('created_by')
+        assert video.is_published() is False
+        assert mock_status.call_count == 0
+
+        # computed once, on first access
+        assert video['_files'] == []
+        assert video.get('_files') == []
+        assert mock_files.call_count == 1
+        assert video['_deposit']['state'] == {}
+        assert video['_deposit'].get('state') == {}
+        assert mock_status.call_count == 1
+
+        # explicit values are kept
+        video = Video.get_record(video_1.id)
+        video['_files'] = [{'key': 'test.mp4'}]
+        assert video['_files'] == [{'key': 'test.mp4'}]
+        assert mock_files.call_count == 1
+
+        # dumps always updates the tasks status
+        video = Video.get_record(video_1.id)
+        data = video.dumps()
+        assert data['_files'] == []
+        assert data['_deposit']['state'] == {}
+        video.dumps()
+        assert mock_files.call_count == 2
+        assert mock_status.call_count == 3
+
+        # opt-in for eager loading
+        videos = Video.get_records([video_1.id, video_2.id], eager=True)
+        assert len(videos) == 2
+        assert mock_files.call_count == 4
+        assert mock_status.call_count == 5
+
+
+def test_lazy_tasks_status_and_files_whole_reads(api_app, api_project):
+    """Test reading a whole deposit computes its lazy fields first."""
+    project, video_1, video_2 = api_project
+    files = [{'key': 'test.mp4'}]
+    state = {'file_download': 'SUCCESS'}
+
+    def check(read):
+        with mock.patch.object(Video, '_get_files_dump',
+                               return_value=files), \
+                mock.patch.object(Video, '_current_tasks_status',
+                                  return_value=state):
+            data = read(Video.get_record(video_1.id))
+        assert data['_files'] == files
+        assert data['_deposit']['state'] == state
+
+    check(lambda video: dict(video))
+    check(lambda video: dict(video.items()))
+    check(lambda video: video.copy())
+    check(lambda video: json.loads(json.dumps(video)))
+    check(lambda video: json.loads(json.dumps(dict(video))))
+    check(lambda video: {key: video[key] for key in video})
+
+    # the fields updated are not computed anymore
+    with mock.patch.object(Video, '_get_files_dump') as mock_files, \
+            mock.patch.object(Video, '_current_tasks_status') as mock_status:
+        video = Video.get_record(video_1.id)
+        video.update({'_files': files})
+        video['_deposit'].update(state=state)
+        assert dict(video)['_files'] == files
+        assert dict(video)['_deposit']['state'] == state
+        assert mock_files.called is False
+        assert mock_status.called is False
+
+
+def test_reindex_queue(api_app, api_project):
+    """Test the reindex of the deposits is debounced."""
+    project, video_1, video_2 = api_project
+    redis = reindex_queue._redis()
+    redis.delete(reindex_queue.pending_key, reindex_queue.flush_key,
+                 reindex_queue.stats_key)
+
+    with mock.patch('cds.modules.deposit.tasks.flush_reindex_queue'
+                    '.apply_async') as mock_flush, \
+            mock.patch('invenio_indexer.api.RecordIndexer.bulk_index') \
+            as mock_indexer:
+        # every task of a video updates the video and its project
+        for _ in range(7):
+            reindex_queue.schedule([video_1.id])
+            reindex_queue.schedule([project.id])
+        # a single flush is scheduled, nothing is indexed yet
+        assert mock_flush.call_count == 1
+        assert mock_indexer.called is False
+        stats = reindex_queue.stats
+        assert stats['depth'] == 2
+        assert stats['scheduled'] == 14
+
+        assert reindex_queue.flush() == 2
+        assert mock_indexer.call_count == 1
+        assert set(get_indexed_records_from_mock(mock_indexer)) == \
+            set([str(video_1.id), str(project.id)])
+        stats = reindex_queue.stats
+        assert stats['depth'] == 0
+        assert stats['flushes'] == 1
+        assert stats['dedup_ratio'] == 1 - 2 / 14.0
+
+        # the next update schedules a new flush
+        reindex_queue.schedule([video_2.id])
+        assert mock_flush.call_count == 2
+        assert reindex_queue.flush() == 1
+        assert reindex_queue.flush() == 0
+
+
+def test_indexer_receiver_prefetch(api_app, api_project):
+    """Test the deposits are enriched before index without reloading."""
+    project, video_1, video_2 = api_project
+    deposits = [project, video_1, video_2]
+    expected = {}
+    for deposit in deposits:
+        deposit = deposit.__class__.get_record(deposit.id)
+        expected[deposit.id] = (deposit['_deposit']['state'],
+                                deposit['_files'])
+    files_dump_cache.invalidate(
+        [deposit['_buckets']['deposit'] for deposit in deposits])
+
+    with mock.patch.object(CDSFilesIterator, 'dump_buckets',
+                           side_effect=CDSFilesIterator.dump_buckets) \
+            as mock_dump, \
+            mock.patch.object(Project, 'get_record') as mock_project, \
+            mock.patch.object(Video, 'get_record') as mock_video:
+        # the dumps of all the buckets are computed together
+        prefetch_deposits([deposit.id for deposit in deposits])
+        assert mock_dump.call_count == 1
+        for deposit in deposits:
+            record = Record.get_record(deposit.id)
+            data = record.dumps()
+            cdsdeposit_indexer_receiver(api_app, json=data, record=record)
+            assert (data['_deposit']['state'], data['_files']) == \
+                expected[deposit.id]
+        # the deposits are neither loaded again nor their files dumped
+        assert mock_project.called is False
+        assert mock_video.called is False
+        assert mock_dump.call_count == 1
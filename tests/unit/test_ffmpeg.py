@@ -28,16 +28,23 @@ from __future__ import absolute_import
 
 import json
 import shutil
+import signal
 import tempfile
+import time
 from os import listdir
 from os.path import dirname, isfile, join
 
+import mock
 import pytest
-from cds.modules.ffmpeg import ff_frames, ff_probe, ff_probe_all
-from cds.modules.ffmpeg.errors import (FrameExtractionExecutionError,
+from cds.modules.ffmpeg import ff_frames, ff_gif, ff_probe, ff_probe_all, \
+    probe_cache
+from cds.modules.ffmpeg.errors import (FFmpegExecutionError,
+                                       FrameExtractionExecutionError,
                                        FrameExtractionInvalidArguments,
                                        MetadataExtractionExecutionError)
+from cds.modules.ffmpeg.ffmpeg import run_command
 from cds_sorenson.api import get_available_aspect_ratios
+from PIL import Image
 
 
 def test_error_report(datadir):
@@ -60,6 +67,45 @@ def test_error_report(datadir):
     assert not_found in repr(e.value)
     assert not_found in e.value.error_message
 
+    with pytest.raises(FrameExtractionExecutionError) as e:
+        ff_frames('invalid_filename', 10, 20, 2, 100, '', single_pass=False)
+    assert not_found in repr(e.value)
+    assert not_found in e.value.error_message
+
+
+def test_command_timeout():
+    """Test that commands running for too long get killed."""
+    with pytest.raises(FFmpegExecutionError) as e:
+        run_command('sleep 10', timeout=1)
+    assert e.value.error_code == -signal.SIGKILL
+
+
+def test_frames_parallel_kill(app):
+    """Test that the frames still being extracted get killed on error."""
+    commands = ['ls invalid_filename'] + ['sleep 10'] * 5
+    with mock.patch('cds.modules.ffmpeg.ffmpeg._ff_frame_command',
+                    side_effect=commands):
+        start = time.time()
+        with pytest.raises(FrameExtractionExecutionError):
+            ff_frames('invalid_filename', 10, 20, 2, 100, '{0}',
+                      single_pass=False)
+        assert time.time() - start < 5
+
+
+def test_frames_single_pass(app):
+    """Test that all the frames are extracted by one process."""
+    with mock.patch('cds.modules.ffmpeg.ffmpeg.run_command') as run, \
+            mock.patch('cds.modules.ffmpeg.ffmpeg.os.path.exists',
+                       return_value=True):
+        ff_frames('video.mp4', 10, 20, 2, 100, 'frame-{0}.jpg',
+                  single_pass=True)
+    assert run.call_count == 1
+    command = run.call_args[0][0]
+    for i, timestamp in enumerate(range(10, 22, 2)):
+        assert '-ss {0} -i video.mp4'.format(timestamp) in command
+        assert '-map {0}:v -frames:v 1 frame-{1}.jpg'.format(
+            i, i + 1) in command
+
 
 def test_ffprobe(video):
     """Test ff_probe wrapper."""
@@ -90,6 +136,13 @@ def test_ffprobe(video):
     check_metadata('duration', convertor=float, e=0.2)
 
 
+def test_ffprobe_no_video_stream():
+    """Test ff_probe on an input without video stream."""
+    with mock.patch('cds.modules.ffmpeg.ffmpeg.run_command',
+                    return_value=b'{"format": {}, "streams": []}'):
+        assert ff_probe('audio_only.mp3', 'width') == b''
+
+
 @pytest.mark.parametrize('start, end, step, error', [
     (5, 95, 10, None),  # CDS use-case
     (4, 88, 12, None),
@@ -98,7 +151,8 @@ def test_ffprobe(video):
     (0, 100, 1, FrameExtractionInvalidArguments),
     (5, 10, 2, FrameExtractionInvalidArguments),
 ])
-def test_frames(video_with_small, start, end, step, error):
+@pytest.mark.parametrize('single_pass', [True, False])
+def test_frames(video_with_small, start, end, step, error, single_pass):
     """Test frame extraction."""
     frame_indices = []
     tmp = tempfile.mkdtemp(dir=dirname(__file__))
@@ -116,7 +170,8 @@ def test_frames(video_with_small, start, end, step, error):
         step=time_step,
         duration=duration,
         output=join(tmp, 'img{0:02d}.jpg'),
-        progress_callback=lambda i: frame_indices.append(i))
+        progress_callback=lambda i: frame_indices.append(i),
+        single_pass=single_pass)
 
     # Extract frames
     if error:
@@ -136,6 +191,25 @@ def test_frames(video_with_small, start, end, step, error):
     shutil.rmtree(tmp)
 
 
+def test_gif(video):
+    """Test GIF creation from extracted frames."""
+    tmp = tempfile.mkdtemp(dir=dirname(__file__))
+    duration = float(ff_probe(video, 'duration'))
+    ff_frames(input_file=video, start=duration * 0.05,
+              end=duration * 0.95 + 0.01, step=duration * 0.1,
+              duration=duration, output=join(tmp, 'frame-{:d}.jpg'))
+
+    ff_gif(input_pattern=join(tmp, 'frame-%d.jpg'),
+           output=join(tmp, 'frames.gif'), width=320)
+
+    gif = Image.open(join(tmp, 'frames.gif'))
+    assert gif.is_animated
+    assert gif.n_frames == 10
+    assert gif.size[0] == 320
+
+    shutil.rmtree(tmp)
+
+
 def test_ffprobe_all(online_video):
     """Test ff_probe_all wrapper."""
     information = json.loads(ff_probe_all(online_video))
@@ -152,6 +226,25 @@ def test_ffprobe_all(online_video):
     assert all([key in information['format'] for key in format_keys])
 
 
+def test_probe_cache(video):
+    """Test that ffprobe metadata is cached."""
+    probe_cache.clear()
+
+    metadata = ff_probe_all(video)
+    assert probe_cache.stats == dict(hits=0, misses=1, size=1)
+    assert ff_probe_all(video) == metadata
+    assert ff_probe(video, 'width') == b'640'
+    assert ff_probe(video, 'display_aspect_ratio')
+    assert probe_cache.stats == dict(hits=3, misses=1, size=1)
+
+    # Checksum takes precedence over the file location
+    assert ff_probe_all(video, checksum='md5:1234') == metadata
+    assert ff_probe_all('invalid_filename', checksum='md5:1234') == metadata
+    assert probe_cache.stats == dict(hits=4, misses=2, size=2)
+
+    probe_cache.clear()
+
+
 def test_aspect_ratio(video, online_video):
     """Test calculation of video's aspect ratio."""
     for video in [video, online_video]:
@@ -28,7 +28,13 @@ from __future__ import absolute_import, print_function
 
 import json
 
+import mock
+from cds.modules.records.api import Keyword
+from cds.modules.records.cache import refs_cache
+from cds.modules.records.jsonresolver.keywords import keyword_jsonresolver
+from cds.modules.records.resolver import keyword_resolver
 from flask import url_for
+from helpers import create_keyword
 from time import sleep
 
 
@@ -97,3 +103,63 @@ def test_suggest_keyword_from_url(api_app, db, es, indexer, pidstore,
         assert res.status_code == 200
         data = json.loads(res.data.decode('utf-8'))
         assert len(data['suggest-name'][0]['options']) == 0
+
+
+def test_keyword_jsonresolver_copy(api_app, keyword_1):
+    """Test the keywords resolved can be changed by the callers."""
+    with api_app.test_request_context():
+        keyword = keyword_jsonresolver('1')
+        keyword['name'] = 'Higgs'
+        assert keyword_jsonresolver('1') == keyword_1
+
+        keyword = refs_cache.resolve('kwid', '5', lambda: Keyword(
+            {'key_id': '5', 'tags': ['video']}))
+        keyword['tags'].append('audio')
+        assert refs_cache.resolve('kwid', '5', None) == {
+            'key_id': '5', 'tags': ['video']}
+
+
+def test_keyword_jsonresolver_cache(api_app, db, keyword_1):
+    """Test the keywords resolved are cached."""
+    # share the references between requests, starting from a clean state
+    redis_url = api_app.config['CACHE_REDIS_URL']
+    with mock.patch.dict(api_app.config, CDS_REFS_CACHE_REDIS_URL=redis_url), \
+            mock.patch.object(keyword_resolver, 'resolve',
+                              wraps=keyword_resolver.resolve) as mock_resolve:
+        refs_cache.invalidate([refs_cache._key('kwid', key_id)
+                               for key_id in ('1', '4')])
+
+        # resolved once per request
+        with api_app.test_request_context():
+            assert keyword_jsonresolver('1') == keyword_1
+            assert keyword_jsonresolver('1') == keyword_1
+        assert mock_resolve.call_count == 1
+
+        # shared between requests
+        with api_app.test_request_context():
+            assert keyword_jsonresolver('1') == keyword_1
+        assert mock_resolve.call_count == 1
+
+        with api_app.test_request_context():
+            keyword = Keyword.get_record(keyword_1.id)
+            keyword['name'] = 'Higgs'
+            keyword.commit()
+            # not committed yet, read from the database
+            assert keyword_jsonresolver('1')['name'] == 'Higgs'
+            assert mock_resolve.call_count == 2
+            db.session.commit()
+
+        # invalidated on commit
+        with api_app.test_request_context():
+            assert keyword_jsonresolver('1')['name'] == 'Higgs'
+        with api_app.test_request_context():
+            assert keyword_jsonresolver('1')['name'] == 'Higgs'
+        assert mock_resolve.call_count == 3
+
+        # a stale reference is invalidated when its record is created
+        with api_app.test_request_context():
+            refs_cache.resolve('kwid', '4', lambda: Keyword(
+                {'key_id': '4', 'name': 'Stale'}), record_cls=Keyword)
+        create_keyword(data={'key_id': '4', 'name': 'Fresh'})
+        with api_app.test_request_context():
+            assert keyword_jsonresolver('4')['name'] == 'Fresh'
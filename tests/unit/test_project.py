@@ -41,10 +41,11 @@ from cds.modules.deposit.api import (record_build_url, Project, Video,
                                      is_deposit, record_unbuild_url,
                                      deposit_project_resolver,
                                      record_video_resolver,
-                                     deposit_video_resolver)
+                                     deposit_video_resolver,
+                                     deposit_videos_resolver)
 from invenio_accounts.models import User
 from invenio_pidstore.providers.recordid import RecordIdProvider
-from invenio_pidstore.errors import PIDInvalidAction
+from invenio_pidstore.errors import PIDDoesNotExistError, PIDInvalidAction
 from jsonschema.exceptions import ValidationError
 from cds.modules.deposit.errors import DiscardConflict
 from cds.modules.webhooks.status import get_deposit_events
@@ -106,6 +107,40 @@ def test_publish_all_videos(api_app, api_project):
         assert video['_deposit']['status'] == 'published'
 
 
+@mock.patch('cds.modules.records.providers.CDSRecordIdProvider.create',
+            RecordIdProvider.create)
+def test_publish_videos_batched(api_app, api_project):
+    """Test publish of the project videos with one project update."""
+    (project, video_1, video_2) = api_project
+    prepare_videos_for_publish([video_1, video_2])
+
+    with mock.patch.object(Project, 'commit', autospec=True,
+                           side_effect=Project.commit) as commit, \
+            mock.patch.object(Project, 'get_record',
+                              side_effect=Project.get_record) as get_record:
+        videos = project._publish_videos()
+    # the project is neither reloaded nor committed by each video
+    assert get_record.called is False
+    assert commit.call_count == 1
+    assert [video['_deposit']['status'] for video in videos] == \
+        ['published', 'published']
+    assert project.video_ids == [str(video['recid']) for video in videos]
+    assert project.report_number
+
+
+def test_deposit_videos_resolver(api_app, api_project):
+    """Test resolve many videos at once."""
+    (project, video_1, video_2) = api_project
+    ids = [video_2['_deposit']['id'], video_1['_deposit']['id']]
+
+    videos = deposit_videos_resolver(ids)
+    assert [video.id for video in videos] == [video_2.id, video_1.id]
+    assert all(isinstance(video, Video) for video in videos)
+    assert deposit_videos_resolver([]) == []
+    with pytest.raises(PIDDoesNotExistError):
+        deposit_videos_resolver(ids + ['not-existing'])
+
+
 @mock.patch('cds.modules.records.providers.CDSRecordIdProvider.create',
             RecordIdProvider.create)
 def test_publish_one_video(api_app, api_project):
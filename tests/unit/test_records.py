@@ -271,3 +271,24 @@ def test_videos_search(api_app, indexed_videos):
         res = client.get(search_url, query_string={'q': 'Project'})
         assert_hits_len(res, 0)
         assert res.status_code == 200
+
+
+def test_schema_index(app, project_published):
+    """Test that the index of a schema is computed only once."""
+    from cds.modules.deposit.api import Project, Video, get_deposit_class
+    from cds.modules.records.utils import is_deposit, is_record, \
+        schema_to_index
+
+    (project, video_1, video_2) = project_published
+    with mock.patch.dict('cds.modules.records.utils._schemas_indices',
+                         clear=True), \
+            mock.patch('cds.modules.records.utils.schema_to_index',
+                       side_effect=schema_to_index) as mock_schema_to_index:
+        assert is_deposit(project)
+        assert not is_record(project)
+        assert is_deposit(video_1)
+        assert mock_schema_to_index.call_count == 2
+
+    assert get_deposit_class(project['$schema']) is Project
+    assert get_deposit_class(video_1['$schema']) is Video
+    assert get_deposit_class('http://example.org/unknown.json') is None
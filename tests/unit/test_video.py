@@ -49,6 +49,7 @@ from invenio_webhooks.models import Event
 from jsonschema.exceptions import ValidationError
 from mock import MagicMock
 from six import BytesIO
+from sqlalchemy import event as sa_event
 from time import sleep
 
 from cds.modules.deposit.api import (record_build_url, video_build_url,
@@ -59,6 +60,7 @@ from cds.modules.deposit.api import (record_build_url, video_build_url,
 from cds.modules.webhooks.status import get_deposit_events, \
     get_tasks_status_by_task
 from cds.modules.fixtures.video_utils import add_master_to_video
+from cds.modules.webhooks.tasks import bulk_create_tags
 
 from helpers import workflow_receiver_video_failing, mock_current_user, \
     get_indexed_records_from_mock, prepare_videos_for_publish
@@ -239,6 +241,96 @@ def test_video_dumps(db, api_project, video):
     assert len(files['subformat']) == 1
 
 
+def test_video_dumps_queries(db, api_project, video):
+    """Test the number of queries of a file dump doesn't grow with files."""
+    (project, video_1, video_2) = api_project
+    bucket_id = video_1['_buckets']['deposit']
+    master = ObjectVersion.create(
+        bucket=bucket_id, key='master.mp4', stream=open(video, 'rb'))
+
+    def add_slaves(start, end):
+        for i in range(start, end):
+            slave = ObjectVersion.create(
+                bucket=bucket_id, key='frame-{0}.jpeg'.format(i),
+                stream=BytesIO(b'\x00' * 1024))
+            ObjectVersionTag.create(slave, 'master', str(master.version_id))
+            ObjectVersionTag.create(slave, 'media_type', 'image')
+            ObjectVersionTag.create(slave, 'context_type', 'frame')
+        db.session.commit()
+
+    def count_queries():
+        statements = []
+
+        def count(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        iterator = Video.get_record(video_1.id).files
+        sa_event.listen(db.engine, 'before_cursor_execute', count)
+        try:
+            files = iterator.dumps()
+        finally:
+            sa_event.remove(db.engine, 'before_cursor_execute', count)
+        return len(statements), files
+
+    add_slaves(0, 2)
+    (queries, files) = count_queries()
+    assert len(files) == 1
+    assert len(files[0]['frame']) == 2
+
+    add_slaves(2, 12)
+    (more_queries, files) = count_queries()
+    assert len(files) == 1
+    assert [f['key'] for f in files[0]['frame']] == [
+        'frame-{}.jpeg'.format(i) for i in range(12)]
+    assert more_queries == queries
+
+
+def test_video_dumps_cache(db, api_project, video):
+    """Test the files dump of an unchanged bucket is cached."""
+    (project, video_1, video_2) = api_project
+    bucket_id = video_1['_buckets']['deposit']
+    master = ObjectVersion.create(
+        bucket=bucket_id, key='master.mp4', stream=open(video, 'rb'))
+    db.session.commit()
+
+    def dump():
+        return Video.get_record(video_1.id).files.dumps()
+
+    with mock.patch.object(CDSFilesIterator, '_dump_bucket', autospec=True,
+                           side_effect=CDSFilesIterator._dump_bucket) \
+            as mock_dump:
+        files = dump()
+        assert mock_dump.call_count == 1
+        assert dump() == files
+        assert dump() == files
+        assert mock_dump.call_count == 1
+
+        # changes not yet committed are always visible
+        ObjectVersionTag.create(master, 'media_type', 'video')
+        assert dump()[0]['media_type'] == 'video'
+        assert mock_dump.call_count > 1
+
+        # committed changes invalidate the cache
+        db.session.commit()
+        calls = mock_dump.call_count
+        assert dump()[0]['media_type'] == 'video'
+        assert dump()[0]['media_type'] == 'video'
+        assert mock_dump.call_count == calls + 1
+
+        # as well as tags created in bulk
+        slave = ObjectVersion.create(
+            bucket=bucket_id, key='frame-1.jpg', stream=BytesIO(b'\x00'))
+        db.session.commit()
+        dump()
+        bulk_create_tags([(slave, dict(
+            master=str(master.version_id), media_type='image',
+            context_type='frame'))])
+        db.session.commit()
+        files = dump()
+        assert len(files) == 1
+        assert [f['key'] for f in files[0]['frame']] == ['frame-1.jpg']
+
+
 @mock.patch('cds.modules.records.providers.CDSRecordIdProvider.create',
             RecordIdProvider.create)
 def test_video_delete_with_workflow(api_app, users, api_project, webhooks, es):
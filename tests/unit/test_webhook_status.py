@@ -28,12 +28,21 @@ from __future__ import absolute_import
 
 import mock
 import json
+import pytest
+from celery import current_app as celery_app
 from celery import states
+from celery.result import AsyncResult
 from copy import deepcopy
 from flask import url_for
 from collections import namedtuple
+from cds.modules.deposit.api import deposit_project_resolver, \
+    deposit_video_resolver
+from cds.modules.webhooks.models import ix_webhooks_events_deposit_id
 from cds.modules.webhooks.status import GetInfoByID, iterate_result, \
-    CollectStatusesByTask
+    CollectStatusesByTask, ComputeGlobalStatus, ResultsSnapshot, \
+    collect_info, get_deposit_events, get_deposits_tasks_status, \
+    get_events_for_deposits, get_tasks_meta, normalize_deposit_ids, \
+    tasks_status_store
 from invenio_webhooks.models import Event
 from helpers import mock_current_user
 
@@ -136,3 +145,155 @@ def test_collect_statuses_by_task():
         'file_download': states.PENDING,
         'file_transcode': states.SUCCESS,
     }
+
+
+def test_tasks_status_store(api_app, db, api_project):
+    """Test the materialized status of the tasks of the deposits."""
+    (project, video_1, video_2) = api_project
+    video_1_depid = video_1['_deposit']['id']
+    video_2_depid = video_2['_deposit']['id']
+    for depid in (video_1_depid, video_2_depid):
+        tasks_status_store.invalidate(depid)
+
+    with mock.patch('cds.modules.webhooks.status.get_events_for_deposits',
+                    return_value=[]) as mock_events:
+        # populated from the events on first read
+        assert tasks_status_store.get(video_1_depid) is None
+        assert get_deposits_tasks_status([video_1_depid]) == {}
+        assert mock_events.call_count == 1
+        assert tasks_status_store.get(video_1_depid) == {}
+
+        # the tasks update their own status
+        tasks_status_store.update(
+            video_1_depid, 'task-1', 'file_transcode', states.STARTED)
+        tasks_status_store.update(
+            video_1_depid, 'task-2', 'file_transcode', states.SUCCESS)
+        tasks_status_store.update(
+            video_1_depid, 'task-3', 'file_download', states.SUCCESS)
+        assert get_deposits_tasks_status([video_1_depid]) == {
+            'file_transcode': states.STARTED,
+            'file_download': states.SUCCESS,
+        }
+        tasks_status_store.update(
+            video_1_depid, 'task-1', 'file_transcode', states.FAILURE)
+        # a late populate doesn't override the status sent by the tasks
+        tasks_status_store.populate(
+            video_1_depid, {'task-1': ('file_transcode', states.STARTED)})
+
+        # deposits are loaded without looking at the events
+        video = deposit_video_resolver(video_1_depid)
+        project = deposit_project_resolver(project['_deposit']['id'])
+        calls = mock_events.call_count
+        video = deposit_video_resolver(video_1_depid)
+        project = deposit_project_resolver(project['_deposit']['id'])
+        assert mock_events.call_count == calls
+
+        expected = {
+            'file_transcode': states.FAILURE,
+            'file_download': states.SUCCESS,
+        }
+        assert video['_deposit']['state'] == expected
+        assert project['_deposit']['state'] == expected
+
+        # populated again after being invalidated
+        tasks_status_store.invalidate(video_1_depid)
+        assert get_deposits_tasks_status([video_1_depid]) == {}
+        assert mock_events.call_count == calls + 1
+
+
+def test_get_events_for_deposits(api_app, db, users):
+    """Test the lookup of the events of the deposits."""
+    assert ix_webhooks_events_deposit_id in Event.__table__.indexes
+
+    events = {}
+    for deposit_id in ('dep-1', 'dep-1', 'dep-2', 'dep-3'):
+        event = Event(receiver_id='avc', user_id=users[0],
+                      payload=dict(deposit_id=deposit_id))
+        db.session.add(event)
+        events.setdefault(deposit_id, set()).add(event)
+    db.session.add(Event(receiver_id='avc', user_id=users[0], payload={}))
+    db.session.commit()
+
+    assert set(get_deposit_events('dep-1')) == events['dep-1']
+    assert set(get_deposit_events('dep-2')) == events['dep-2']
+    assert get_deposit_events('dep-4') == []
+    assert set(get_events_for_deposits(['dep-1', 'dep-3', 'dep-4'])) == \
+        events['dep-1'] | events['dep-3']
+    assert get_events_for_deposits([]) == []
+
+
+def test_project_tasks_status_batched(api_app, db, api_project):
+    """Test the tasks of all the videos of a project are read at once."""
+    (project, video_1, video_2) = api_project
+    video_ids = [video_1['_deposit']['id'], video_2['_deposit']['id']]
+    for depid in video_ids:
+        tasks_status_store.invalidate(depid)
+
+    with mock.patch('cds.modules.webhooks.status.get_events_for_deposits',
+                    wraps=get_events_for_deposits) as mock_events, \
+            mock.patch('cds.modules.webhooks.status.get_tasks_meta',
+                       wraps=get_tasks_meta) as mock_metas:
+        deposit_project_resolver(project['_deposit']['id'])
+        assert mock_events.call_count == 1
+        assert sorted(mock_events.call_args[0][0]) == sorted(video_ids)
+        assert mock_metas.call_count == 1
+
+
+def test_normalize_deposit_ids(api_app, db, api_project_published):
+    """Test the PIDs of the published videos are resolved to deposit ids."""
+    (project, video_1, video_2) = api_project_published
+    assert normalize_deposit_ids([
+        video_1['_deposit']['pid'],
+        video_2['_deposit']['id'],
+        {'type': 'recid', 'value': 'missing'},
+    ]) == [str(video_1['_deposit']['id']), str(video_2['_deposit']['id'])]
+
+
+def test_get_tasks_meta(api_app):
+    """Test the batched read of the meta of the tasks."""
+    celery_app.backend.store_result('task-1', {'a': 1}, states.STARTED)
+    celery_app.backend.store_result('task-2', None, states.SUCCESS)
+
+    metas = get_tasks_meta(['task-1', 'task-2', 'task-3', 'task-1'])
+    assert set(metas.keys()) == {'task-1', 'task-2', 'task-3'}
+    assert metas['task-1']['status'] == states.STARTED
+    assert metas['task-1']['result'] == {'a': 1}
+    assert metas['task-2']['status'] == states.SUCCESS
+    assert metas['task-3'] == {'status': states.PENDING, 'result': None}
+
+
+def test_results_snapshot(api_app):
+    """Test all the results of a raw info tree are read at once."""
+    backend = celery_app.backend
+    backend.store_result('snap-1', {'a': 1}, states.STARTED)
+    backend.store_result('snap-2', ValueError('boom'), states.FAILURE)
+    raw_info = (
+        [{'first': AsyncResult('snap-1')}],
+        [{'second': AsyncResult('snap-2')}, {'third': AsyncResult('snap-3')}]
+    )
+
+    with mock.patch.object(backend, 'mget', wraps=backend.mget) as mget:
+        snapshot = ResultsSnapshot(raw_info)
+        global_status = ComputeGlobalStatus()
+        snapshot.iterate_result(fun=global_status)
+        info = snapshot.iterate_result(fun=collect_info)
+        assert mget.call_count == 1
+
+    assert global_status.status == states.FAILURE
+    assert info[0][0]['status'] == states.STARTED
+    assert info[0][0]['info'] == {'a': 1}
+    assert info[0][0]['name'] == 'first'
+    assert info[1][0]['status'] == states.FAILURE
+    assert isinstance(info[1][0]['info'], Exception)
+    assert info[1][0]['info'].args == ('boom', )
+    assert info[1][1]['status'] == states.PENDING
+    assert info[1][1]['info'] is None
+
+    # only part of the tree
+    assert snapshot.iterate_result(
+        fun=lambda task_name, result: result.id,
+        raw_info=raw_info[1]) == ['snap-2', 'snap-3']
+
+    # views can't be changed
+    with pytest.raises(AttributeError):
+        snapshot['snap-1'].status = states.SUCCESS
@@ -25,6 +25,10 @@
 
 from __future__ import absolute_import
 
+import hashlib
+import json
+import os
+import tempfile
 import threading
 import time
 import mock
@@ -37,14 +41,20 @@ from invenio_pidstore.models import PersistentIdentifier
 from invenio_records import Record
 from invenio_records.models import RecordMetadata
 from six import BytesIO, next
+from celery import states
 from celery.exceptions import Retry, Ignore
+from celery.result import AsyncResult
+from sqlalchemy import event
 from sqlalchemy.orm.exc import ConcurrentModificationError
 from cds_sorenson.error import InvalidResolutionError
 
+from cds.modules.webhooks.download import (download_ranges, journal_path,
+                                           remove_partial_download)
 from cds.modules.webhooks.tasks import (DownloadTask,
                                         update_record, ExtractFramesTask,
                                         ExtractMetadataTask,
-                                        TranscodeVideoTask)
+                                        TranscodeVideoTask, bulk_create_tags,
+                                        file_checksums, monitor_transcoding)
 
 from helpers import add_video_tags, get_object_count, transcode_task
 
@@ -86,6 +96,134 @@ def test_download_to_object_version(db, bucket):
         assert Bucket.get(bid).size == 0
 
 
+def test_download_ranges(app, db, bucket, http_server):
+    """Test download with concurrent range requests."""
+    obj = ObjectVersion.create(bucket=bucket, key='video.mp4')
+    version_id = str(obj.version_id)
+    db.session.commit()
+    size = len(http_server.content)
+
+    with mock.patch.dict(app.config, {'CDS_DOWNLOAD_CONNECTIONS': 4,
+                                      'CDS_DOWNLOAD_CHUNK_SIZE': 10 * 1024}):
+        DownloadTask().s(http_server.url, version_id=version_id).delay()
+
+    # First request to get the headers, then one per chunk
+    assert len(http_server.requests) == 1 + 10
+    obj = ObjectVersion.query.get(version_id)
+    assert obj.file.size == size
+    with obj.file.storage().open() as fp:
+        assert fp.read() == http_server.content
+    # The staged file was copied in the bucket and removed
+    output = DownloadTask._partial_download(version_id)
+    assert obj.file.uri != output
+    assert not os.path.exists(output)
+    assert not os.path.exists(journal_path(output))
+    assert obj.bucket.size == size
+
+
+def test_download_ranges_failure(app, db, bucket, http_server):
+    """Test the partial download is removed once the task gives up."""
+    obj = ObjectVersion.create(bucket=bucket, key='video.mp4')
+    version_id = str(obj.version_id)
+    db.session.commit()
+    output = DownloadTask._partial_download(version_id)
+
+    def fail(uri, output, *args, **kwargs):
+        with open(output, 'wb'), open(journal_path(output), 'w'):
+            pass
+        raise IOError('Connection reset')
+
+    with mock.patch.dict(app.config, {'CDS_DOWNLOAD_CONNECTIONS': 4,
+                                      'CDS_DOWNLOAD_CHUNK_SIZE': 10 * 1024,
+                                      'CDS_DOWNLOAD_MAX_RETRIES': 0}), \
+            mock.patch('cds.modules.webhooks.tasks.download_ranges',
+                       side_effect=fail), \
+            pytest.raises(IOError):
+        DownloadTask().s(http_server.url, version_id=version_id).delay()
+
+    assert not os.path.exists(output)
+    assert not os.path.exists(journal_path(output))
+
+
+def test_download_ranges_resume(http_server):
+    """Test resuming a ranged download from the complete chunks."""
+    size = len(http_server.content)
+    chunk_size = 10 * 1024
+    output = tempfile.mktemp()
+    # First half was downloaded, second half is garbage
+    with open(output, 'wb') as fp:
+        fp.write(http_server.content[:size // 2])
+        fp.write(b'\x00' * (size - size // 2))
+    with open(journal_path(output), 'w') as fp:
+        fp.writelines('{0}-{1}\n'.format(start, start + chunk_size - 1)
+                      for start in range(0, size // 2, chunk_size))
+
+    progress = []
+    download_ranges(http_server.url, output, size, chunk_size, 2,
+                    progress_callback=lambda s, t: progress.append(t))
+
+    assert len(http_server.requests) == 5
+    assert sorted(progress) == progress
+    assert progress[-1] == size
+    with open(output, 'rb') as fp:
+        assert fp.read() == http_server.content
+    assert not os.path.exists(journal_path(output))
+    remove_partial_download(output)
+
+
+def test_download_without_ranges(app, db, bucket, http_server):
+    """Test download from a server not accepting range requests."""
+    http_server.accept_ranges = False
+    obj = ObjectVersion.create(bucket=bucket, key='video.mp4')
+    version_id = str(obj.version_id)
+    db.session.commit()
+
+    with mock.patch.dict(app.config, {'CDS_DOWNLOAD_CONNECTIONS': 4,
+                                      'CDS_DOWNLOAD_CHUNK_SIZE': 10 * 1024}):
+        DownloadTask().s(http_server.url, version_id=version_id).delay()
+
+    assert http_server.requests == [None]
+    obj = ObjectVersion.query.get(version_id)
+    with obj.file.storage().open() as fp:
+        assert fp.read() == http_server.content
+
+
+def test_progress_updates_coalescing(app):
+    """Test that progress updates are coalesced."""
+    sent = []
+    task = DownloadTask()
+    task.sse_channel = 'mychannel'
+    task.deposit_id = task.event_id = task.object = None
+    task.set_base_payload()
+
+    def update(percentage, state=states.STARTED):
+        task.update_state(
+            state=state, meta=dict(payload=dict(percentage=percentage)))
+
+    with mock.patch('cds.modules.webhooks.tasks.sse_publish_event',
+                    side_effect=lambda **kwargs: sent.append(
+                        (kwargs['state'],
+                         kwargs['meta']['payload']['percentage']))), \
+            mock.patch('celery.app.task.Task.update_state'), \
+            mock.patch('cds.modules.webhooks.tasks.time.time') as now:
+        now.return_value = 0
+        for percentage in [0, 0.5, 1, 1.2]:
+            update(percentage)
+        # enough time has passed
+        now.return_value = 1
+        update(1.3)
+        update(1.4)
+        # terminal states are always sent
+        update(1.5, state=states.SUCCESS)
+
+    assert sent == [
+        (states.STARTED, 0),
+        (states.STARTED, 1),
+        (states.STARTED, 1.3),
+        (states.SUCCESS, 1.5),
+    ]
+
+
 def test_update_record_thread(app, db):
     """Test update record with multiple concurrent transactions."""
     if db.engine.name == 'sqlite':
@@ -309,6 +447,61 @@ def test_transcode(db, bucket, mock_sorenson):
     assert bucket.size == filesize
 
 
+def test_transcode_async_monitoring(app, db, bucket, fake_sorenson):
+    """Test TranscodeVideoTask task monitored by the periodic poller."""
+    filesize = 1024
+    filename = 'test.mp4'
+    preset_quality = '480p'
+    (version_id, [task_s]) = transcode_task(
+        bucket=bucket, filesize=filesize, filename=filename,
+        preset_qualities=[preset_quality])
+
+    with mock.patch.dict(app.config, {'CDS_SORENSON_ASYNC_MONITORING': True}):
+        task = task_s.delay()
+
+        # The task returns as soon as the job is started
+        assert AsyncResult(task.id).state == states.STARTED
+        slave = ObjectVersion.get(bucket, 'slave_{0}.mp4'.format(preset_quality))
+        assert slave.file is None
+        assert '_sorenson_monitoring' in slave.get_tags()
+
+        for status, percentage in fake_sorenson.statuses[:-1]:
+            monitor_transcoding()
+            result = AsyncResult(task.id)
+            assert result.state == states.STARTED
+            assert result.info['payload']['percentage'] == percentage
+
+        # Last poll finalizes the object version, only once even if another
+        # run loaded the same job concurrently
+        monitoring = json.loads(slave.get_tags()['_sorenson_monitoring'])
+        with mock.patch.object(TranscodeVideoTask, '_finalize',
+                               side_effect=TranscodeVideoTask._finalize) as fin:
+            TranscodeVideoTask.monitor(monitoring)
+            TranscodeVideoTask.monitor(monitoring)
+        assert fin.call_count == 1
+        assert AsyncResult(task.id).state == states.SUCCESS
+        slave = ObjectVersion.get(bucket, 'slave_{0}.mp4'.format(preset_quality))
+        assert slave.file.size == filesize
+        assert slave.file.checksum.startswith('md5:')
+        assert '_sorenson_monitoring' not in slave.get_tags()
+
+        # Nothing left to monitor
+        monitor_transcoding()
+        assert fake_sorenson.stopped == []
+
+
+def test_monitor_transcoding_disabled(app, db):
+    """Test the periodic poller does nothing if async monitoring is off."""
+    with mock.patch.dict(app.config,
+                         {'CDS_SORENSON_ASYNC_MONITORING': False}), \
+            mock.patch('cds.modules.webhooks.tasks.ObjectVersionTag') \
+            as mock_tag, \
+            mock.patch.object(TranscodeVideoTask, 'monitor') as mock_monitor:
+        monitor_transcoding()
+    assert mock_tag.query.filter_by.called is False
+    assert mock_monitor.called is False
+
+
 def test_transcode_2tasks_delete1(db, bucket, mock_sorenson):
     """Test TranscodeVideoTask task when run 2 task and delete 1."""
     def get_bucket_keys():
@@ -371,3 +564,45 @@ def test_transcode_ignore_exception_if_invalid(db, bucket):
         # Transcode
         task = task_s1.delay()
         isinstance(task.result, Ignore)
+
+
+def test_bulk_create_tags(db, bucket):
+    """Test creating the tags of several object versions at once."""
+    objs = [ObjectVersion.create(bucket, key='frame-{0}.jpg'.format(i),
+                                 stream=BytesIO(b'\x00'))
+            for i in range(10)]
+    # load tags before inserting new ones
+    assert objs[0].get_tags() == {}
+
+    statements = []
+
+    def count_inserts(conn, cursor, statement, *args):
+        if statement.startswith('INSERT INTO files_objecttags'):
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count_inserts)
+    try:
+        bulk_create_tags([
+            (obj, dict(media_type='image', context_type='frame', timestamp=i))
+            for i, obj in enumerate(objs)])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count_inserts)
+    db.session.commit()
+
+    assert len(statements) == 1
+    assert ObjectVersionTag.query.count() == 30
+    assert objs[0].get_tags() == dict(
+        media_type='image', context_type='frame', timestamp='0')
+
+
+@pytest.mark.parametrize('use_mmap', [True, False])
+def test_file_checksums(video, use_mmap):
+    """Test checksum calculation in chunks."""
+    with open(video, 'rb') as fp:
+        content = fp.read()
+    checksums = file_checksums(video, algorithms=('md5', 'sha1'),
+                               chunk_size=1000, use_mmap=use_mmap)
+    assert checksums == {
+        'md5': hashlib.md5(content).hexdigest(),
+        'sha1': hashlib.sha1(content).hexdigest(),
+    }